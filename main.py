@@ -5,12 +5,17 @@ Supports FastAPI interface and command line interface
 import os
 import sys
 import argparse
+import asyncio
+import hashlib
 import secrets
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, Depends
+from cachetools import LRUCache, TTLCache
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
 import uvicorn
 
 # Add project root directory to Python path
@@ -18,35 +23,50 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.config import config
 from src.storage.manager import storage
+from src.storage.session_store import session_store
+from src.storage.cache import cached_response, invalidate_cache
 from src.agent.booking_agent import BookingAgent
 
 
 # FastAPI application
-app = FastAPI(title="Restaurant Booking AI Agent", version="1.0.0")
+app = FastAPI(title="Restaurant Booking AI Agent", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Main page is read once at startup and served from memory
+try:
+    _INDEX_HTML: Optional[bytes] = Path("static/index.html").read_bytes()
+    _INDEX_ETAG: Optional[str] = f'"{hashlib.md5(_INDEX_HTML, usedforsecurity=False).hexdigest()}"'
+except FileNotFoundError:
+    _INDEX_HTML = None
+    _INDEX_ETAG = None
+
 
 # API models
-class LoginRequest(BaseModel):
+class RequestModel(BaseModel):
+    """Base for request bodies - unknown fields are rejected instead of silently dropped"""
+    model_config = ConfigDict(extra="forbid")
+
+
+class LoginRequest(RequestModel):
     username: str
     password: str
 
 
-class RegisterRequest(BaseModel):
+class RegisterRequest(RequestModel):
     username: str
     password: str
     profile: Optional[Dict[str, Any]] = None
 
 
-class ChangePasswordRequest(BaseModel):
+class ChangePasswordRequest(RequestModel):
     username: str
     current_password: str
     new_password: str
 
 
-class ChatRequest(BaseModel):
+class ChatRequest(RequestModel):
     session_id: str
     message: str
 
@@ -62,29 +82,71 @@ class UserResponse(BaseModel):
     session_id: str
 
 
-class ProfileUpdateRequest(BaseModel):
+class ProfileUpdateRequest(RequestModel):
     username: str
     profile: Dict[str, Any]
 
 
-class PasswordResetRequest(BaseModel):
+class PasswordResetRequest(RequestModel):
     username: str
     email: str
 
 
-class ResetPasswordRequest(BaseModel):
+class ResetPasswordRequest(RequestModel):
     username: str
     reset_code: str
     new_password: str
 
 
-class DeleteAccountRequest(BaseModel):
+class DeleteAccountRequest(RequestModel):
     username: str
     password: str
 
 
-# User session storage
-active_sessions = {}  # session_id -> {"username": str, "agent": BookingAgent}
+# Agents owned by this worker, shared by all sessions of the same user (session metadata lives in session_store)
+agent_cache = LRUCache(maxsize=256)  # username -> BookingAgent
+
+
+def get_or_create_agent(username: str) -> BookingAgent:
+    """Get the cached Agent for a user, creating it on first use"""
+    agent = agent_cache.get(username)
+    if agent is None:
+        agent = agent_cache.setdefault(username, BookingAgent(username))
+    return agent
+
+
+# bcrypt hashing/verification gets its own pool, sized to the CPUs, so a burst of logins
+# cannot occupy every default to_thread worker needed by database and agent calls
+_PASSWORD_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="password")
+
+
+async def run_password_task(func, *args):
+    """Run a bcrypt-bound storage call on the password pool"""
+    return await asyncio.get_running_loop().run_in_executor(_PASSWORD_POOL, func, *args)
+
+
+# Recent successful password checks - (username, keyed digest of password) -> bcrypt hash they matched.
+# A hit only counts while that hash is still the user's current one in the database, so a password
+# change on any worker (or one landing while the check ran) invalidates it without shared state.
+verify_cache = TTLCache(maxsize=1024, ttl=30)
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+
+
+async def verify_user_cached(username: str, password: str) -> bool:
+    """Verify credentials, skipping bcrypt when the same pair verified within the last 30 seconds"""
+    key = (username, hashlib.blake2b(password.encode("utf-8"), key=_VERIFY_CACHE_KEY).digest())
+    verified_hash = verify_cache.get(key)
+    if verified_hash is not None:
+        if await asyncio.to_thread(storage.get_password_hash, username) == verified_hash:
+            return True
+        verify_cache.pop(key, None)
+    
+    # Only successes are cached so failed attempts always pay the full bcrypt cost
+    verified_hash = await run_password_task(storage.verify_user_hash, username, password)
+    if verified_hash is None:
+        return False
+    verify_cache[key] = verified_hash
+    return True
 
 
 def generate_session_id() -> str:
@@ -92,22 +154,26 @@ def generate_session_id() -> str:
     return secrets.token_urlsafe(32)
 
 
-def get_agent_for_session(session_id: str) -> BookingAgent:
-    """Get Agent for session"""
-    if session_id not in active_sessions:
+async def get_agent_for_session(session_id: str) -> BookingAgent:
+    """Get Agent for session, rebuilding it if this worker has not seen the user yet"""
+    session_data = await session_store.get_session(session_id)
+    if not session_data:
         raise HTTPException(status_code=401, detail="Invalid session ID")
-    return active_sessions[session_id]["agent"]
+    
+    return get_or_create_agent(session_data["username"])
 
 
 # Web interface routes
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     """Return main page"""
-    try:
-        with open("static/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+    if _INDEX_HTML is None:
         raise HTTPException(status_code=404, detail="Page file not found")
+    
+    headers = {"ETag": _INDEX_ETAG, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=_INDEX_HTML, headers=headers)
 
 
 # API routes
@@ -115,7 +181,8 @@ async def read_root():
 async def register_user(request: RegisterRequest):
     """User registration"""
     try:
-        user_id = storage.create_user(request.username, request.password, request.profile)
+        user_id = await run_password_task(storage.create_user, request.username, request.password, request.profile)
+        await invalidate_cache("users:list")
         return {"message": "Registration successful", "user_id": user_id}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -128,20 +195,17 @@ async def login_user(request: LoginRequest):
     """User login"""
     try:
         # Verify username and password
-        if not storage.verify_user(request.username, request.password):
+        if not await verify_user_cached(request.username, request.password):
             raise HTTPException(status_code=401, detail="Username or password incorrect")
         
         # Create session
         session_id = generate_session_id()
         
-        # Initialize Agent
-        agent = BookingAgent(request.username)
+        # Initialize Agent (reused across logins of the same user)
+        get_or_create_agent(request.username)
         
         # Save session
-        active_sessions[session_id] = {
-            "username": request.username,
-            "agent": agent
-        }
+        await session_store.create_session(session_id, {"username": request.username})
         
         return UserResponse(username=request.username, session_id=session_id)
         
@@ -154,8 +218,7 @@ async def login_user(request: LoginRequest):
 @app.post("/logout")
 async def logout_user(session_id: str):
     """User logout"""
-    if session_id in active_sessions:
-        del active_sessions[session_id]
+    await session_store.delete_session(session_id)
     return {"message": "Logout successful"}
 
 
@@ -164,11 +227,12 @@ async def change_password(request: ChangePasswordRequest):
     """Change user password"""
     try:
         # Verify current password
-        if not storage.verify_user(request.username, request.current_password):
+        if not await verify_user_cached(request.username, request.current_password):
             raise HTTPException(status_code=401, detail="Current password is incorrect")
         
         # Update password
-        storage.update_user_password(request.username, request.new_password)
+        await run_password_task(storage.update_user_password, request.username, request.new_password)
+        await invalidate_cache(f"user:{request.username}")
         return {"message": "Password changed successfully"}
         
     except HTTPException:
@@ -196,10 +260,8 @@ async def forgot_password(request: PasswordResetRequest):
         # Generate reset code (in real app, this would be sent via email)
         reset_code = secrets.token_urlsafe(8)
         
-        # Store reset code temporarily (in real app, store in database with expiration)
-        if not hasattr(app.state, 'reset_codes'):
-            app.state.reset_codes = {}
-        app.state.reset_codes[request.username] = reset_code
+        # Store reset code temporarily (expires after RESET_CODE_TTL_SECONDS)
+        await session_store.set_reset_code(request.username, reset_code)
         
         return {
             "message": "Password reset code generated",
@@ -218,18 +280,15 @@ async def reset_password(request: ResetPasswordRequest):
     """Reset password with code"""
     try:
         # Verify reset code
-        if not hasattr(app.state, 'reset_codes'):
-            raise HTTPException(status_code=400, detail="No active reset codes")
-        
-        stored_code = app.state.reset_codes.get(request.username)
+        stored_code = await session_store.get_reset_code(request.username)
         if not stored_code or stored_code != request.reset_code:
             raise HTTPException(status_code=400, detail="Invalid or expired reset code")
         
         # Update password
-        storage.update_user_password(request.username, request.new_password)
+        await run_password_task(storage.update_user_password, request.username, request.new_password)
         
         # Remove used reset code
-        del app.state.reset_codes[request.username]
+        await session_store.delete_reset_code(request.username)
         
         return {"message": "Password reset successfully"}
         
@@ -244,14 +303,18 @@ async def delete_account(request: DeleteAccountRequest):
     """Delete user account"""
     try:
         # Verify password before deletion
-        if not storage.verify_user(request.username, request.password):
+        if not await verify_user_cached(request.username, request.password):
             raise HTTPException(status_code=401, detail="Password is incorrect")
         
         # Delete user account
-        success = storage.delete_user(request.username)
+        success = await asyncio.to_thread(storage.delete_user, request.username)
         if not success:
             raise HTTPException(status_code=404, detail="User not found")
         
+        # Drop the cached agent and responses of the deleted user
+        agent_cache.pop(request.username, None)
+        await invalidate_cache(f"user:{request.username}", "users:list")
+        
         return {"message": "Account deleted successfully"}
         
     except HTTPException:
@@ -278,7 +341,7 @@ async def update_profile(request: ProfileUpdateRequest):
 async def chat(request: ChatRequest):
     """Chat interface - Enhanced version with API debug information"""
     try:
-        agent = get_agent_for_session(request.session_id)
+        agent = await get_agent_for_session(request.session_id)
         response, debug_info = agent.chat_with_debug(request.message)
         
         return ChatResponse(
@@ -296,7 +359,24 @@ async def chat(request: ChatRequest):
         )
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat interface - streams the final answer of the agent run (tool-calling steps are not sent).
+    A client disconnect does not cancel the run; it completes on the agent's bounded stream pool.
+    """
+    try:
+        agent = await get_agent_for_session(request.session_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        # e.g. a still-valid session of a deleted user - reported in the reply text, as /chat does
+        return PlainTextResponse(f"Sorry, an error occurred while processing your request: {str(e)}")
+    return StreamingResponse(agent.chat_stream(request.message), media_type="text/plain; charset=utf-8")
+
+
 @app.get("/user/{username}")
+@cached_response("user:{username}", ttl=60)
 async def get_user_info(username: str):
     """Get user information"""
     try:
@@ -327,10 +407,11 @@ async def update_user_profile(username: str, request: ProfileUpdateRequest):
 
 
 @app.get("/users")
+@cached_response("users:list", ttl=15)
 async def list_users():
     """List all users"""
     try:
-        users = storage.list_users()
+        users = await asyncio.to_thread(storage.list_users)
         return {"users": users}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list users: {str(e)}")
@@ -509,8 +590,9 @@ class CommandLineInterface:
                 # Call Agent for processing
                 print("\n🤖 Assistant: ", end="", flush=True)
                 try:
-                    response = self.current_agent.chat(user_input)
-                    print(response)
+                    for chunk in self.current_agent.chat_stream(user_input):
+                        print(chunk, end="", flush=True)
+                    print()
                 except Exception as e:
                     print(f"Sorry, there was a problem processing your request: {e}")
                     
@@ -556,8 +638,8 @@ class CommandLineInterface:
     
     def _clear_history(self):
         """Clear chat history"""
-        if hasattr(self.current_agent, 'chat_history'):
-            self.current_agent.chat_history = []
+        if hasattr(self.current_agent, 'clear_history'):
+            self.current_agent.clear_history()
             print("✅ Chat history cleared")
         else:
             print("❌ Unable to clear history")
@@ -1,123 +1,33 @@
 """
 Restaurant Booking AI Agent - LangChain-based conversational booking assistant
 """
+import atexit
+import hashlib
 import json
+import queue
+import re
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from cachetools import TLRUCache
+from typing import Any, ClassVar, Dict, FrozenSet, Iterator, List, Optional, Tuple
 from datetime import datetime
 from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.tools import tool
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 
 from ..config import config
 from ..tools.booking_tools import BOOKING_TOOLS
 from ..tools.user_aware_tools import create_user_aware_tools
 from ..storage.manager import storage
 
-class BookingAgent:
-    """Restaurant Booking AI Agent - Supports intent recognition and guided interaction"""
-    
-    def __init__(self, username: str):
-        self.username = username
-        self.user_data = storage.get_user(username)
-        
-        if not self.user_data:
-            raise ValueError(f"User {username} does not exist")
-        
-        # Use a user-aware toolset that automatically fills in stored preferences
-        self.tools = create_user_aware_tools(username)
-        
-        # Initialize LLM - Supports Gemini and OpenAI
-        if "gemini" in config.OPENAI_MODEL.lower():
-            self.llm = ChatGoogleGenerativeAI(
-                google_api_key=config.OPENAI_API_KEY,
-                model=config.OPENAI_MODEL,
-                temperature=0.1
-            )
-        else:
-            llm_kwargs = {
-                "openai_api_key": config.OPENAI_API_KEY,
-                "model_name": config.OPENAI_MODEL,
-                "temperature": 0.1
-            }
-            if config.OPENAI_BASE_URL:
-                llm_kwargs["openai_api_base"] = config.OPENAI_BASE_URL
-            
-            self.llm = ChatOpenAI(**llm_kwargs)
-        
-        # Create an enhanced prompt template
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", self._get_enhanced_system_prompt()),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad")
-        ])
-        
-        # Create the agent
-        self.agent = create_openai_tools_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=self.prompt
-        )
-        
-        # Create the executor - fixed configuration to support full workflow
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True,
-            max_iterations=15,  # Increase iterations to support complex flows
-            return_intermediate_steps=True,  # Return intermediate steps for debugging
-            handle_parsing_errors=True  # Improve error handling
-            # Removed early_stopping_method="force" - this is a key fix
-        )
-        
-        # Load chat history
-        self._load_chat_history()
-    
-    def _get_enhanced_system_prompt(self) -> str:
-        """Get the enhanced system prompt - supports intent recognition and intelligent parameter collection"""
-        # Get current date and time
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        current_time = datetime.now().strftime("%H:%M:%S")
-        current_weekday = datetime.now().strftime("%A")
-        
-        user_profile = self.user_data.get("profile", {})
-        
-        profile_text = ""
-        marketing_preferences_status = ""
-        if user_profile:
-            profile_text = f"\n\n【User Profile Information】\n"
-            for key, value in user_profile.items():
-                if value:
-                    profile_text += f"- {key}: {value}\n"
-            profile_text += "\n📋 When creating a booking, please prioritize using this personal information as default values, without repeatedly asking for existing information."
-            
-            # Analyze marketing preference status
-            marketing_fields = ['ReceiveEmailMarketing', 'ReceiveSMSMarketing', 'ReceiveRestaurantEmailMarketing', 'ReceiveRestaurantSMSMarketing']
-            has_marketing_prefs = any(user_profile.get(field) is not None for field in marketing_fields)
-            
-            if has_marketing_prefs:
-                marketing_preferences_status = f"\n\n🔔 【Marketing Preferences Set】\nUser has set marketing preferences. When creating a booking, use the stored preferences directly without asking again.\nCurrent settings:\n"
-                for field in marketing_fields:
-                    if field in user_profile:
-                        marketing_preferences_status += f"- {field}: {user_profile[field]}\n"
-            else:
-                marketing_preferences_status = f"\n\n🔔 【Marketing Preferences Not Set】\nUser has not yet set marketing preferences. You need to ask and save them during the first booking."
-        
-        return f"""You are a professional restaurant booking AI assistant, helping users manage their reservations at TheHungryUnicorn restaurant.
-
-【IMPORTANT: Current Time Information】
-- Current Date: {current_date}
-- Current Time: {current_time}  
-- Today is: {current_weekday}
-- Please always base your understanding of the user's time requirements (e.g., "today", "tomorrow", "next week") on the current date.
-
-【IMPORTANT: Current User Information】
-- Current Username: {self.username}
-- When calling tools that require a username parameter, please use: {self.username}
+# System prompt = static instructions first, then the per-user/time context.
+# Keeping the prefix byte-identical for every user and build lets provider-side prompt caching reuse it.
+STATIC_SYSTEM_PROMPT = """You are a professional restaurant booking AI assistant, helping users manage their reservations at TheHungryUnicorn restaurant.
+The current date/time and the current user's information are given in the context at the end of these instructions.
 
 【Core Functions & Intent Recognition】
 You need to recognize the user's intent and provide the corresponding service:
@@ -135,7 +45,7 @@ You need to recognize the user's intent and provide the corresponding service:
    - When the user needs to "find the earliest available time" or "check for openings next week", use smart_availability_search_tool.
    - This tool checks multiple days in a single call, avoiding execution chain termination issues.
    - The tool will return a clear "found" or "not found" result, requiring no further processing.
-   - Maximum search days: {config.MAX_AVAILABILITY_SEARCH_DAYS} days (configurable).
+   - Maximum search days: {max_search_days} days (configurable).
 
 2. **Create Booking** (user_create_booking_tool)  
    - Keywords: book, reserve, order, want, make
@@ -162,7 +72,7 @@ When creating a booking, you must collect the following information and include
 - special_requests, room_number, is_leave_time_confirmed: Special requests - Proactively ask "Do you have any special requests? Such as seating preferences, dietary restrictions, or celebrations? Do you have a preference for a seating area? Is there a planned departure time?"
 
 **Marketing Preferences (State-aware Handling):**
-{marketing_preferences_status}
+See the marketing preferences status in the user context below.
 
 **Marketing Preference Collection Rules:**
 1. **Prioritize Stored Preferences**: If the user's profile already has marketing preferences, use them directly without asking.
@@ -227,51 +137,582 @@ When creating a booking, you must collect the following information and include
 - Proactively offer helpful suggestions.
 - Provide confirmation and next steps for successful operations.
 
-Current user: {self.username}{profile_text}
+Based on the user's input, identify their intent and immediately execute the corresponding tool call. Remember: prioritize using stored user information, only collect missing parameters when necessary, and ensure all API-required parameters are included in the tool call.""".format(
+    max_search_days=config.MAX_AVAILABILITY_SEARCH_DAYS
+)
+
+DYNAMIC_PROMPT_TEMPLATE = """
+
+【IMPORTANT: Current Time Information】
+- Current Date: {current_date}
+- Current Time: {current_time}
+- Today is: {current_weekday}
+- Please always base your understanding of the user's time requirements (e.g., "today", "tomorrow", "next week") on the current date.
+
+【IMPORTANT: Current User Information】
+- Current Username: {username}
+- When calling tools that require a username parameter, please use: {username}{marketing_preferences_status}
+
+Current user: {username}{profile_text}"""
+
+
+# Agent prompt shared by all users; the rendered system prompt is passed in as a variable on each run
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "{system_prompt}"),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad")
+])
+
+# Intent keywords mapping, matched in one pass by a precompiled alternation (longest keyword first,
+# so "check booking" is counted once for view_bookings instead of also firing "check")
+INTENT_KEYWORDS = {
+    "check_availability": ["check", "available", "free", "open", "time", "when", "any", "query", "see", "availability", "slot"],
+    "create_booking": ["book", "reserve", "table", "want", "need", "make", "order", "get"],
+    "view_bookings": ["show", "view", "my", "bookings", "reservations", "check booking"],
+    "modify_booking": ["change", "modify", "update", "edit", "move", "adjust", "switch"],
+    "cancel_booking": ["cancel", "remove", "delete", "don't want", "revoke", "not going"]
+}
+_INTENT_KEYWORD_SETS = {intent: frozenset(keywords) for intent, keywords in INTENT_KEYWORDS.items()}
+_INTENT_PATTERN = re.compile("|".join(
+    re.escape(keyword) for keyword in sorted(frozenset().union(*_INTENT_KEYWORD_SETS.values()), key=len, reverse=True)
+))
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Sums token usage of every LLM call in one agent run, including prompt tokens served from cache"""
+    
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+    
+    def on_llm_end(self, response, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                self.prompt_tokens += usage.get("input_tokens", 0)
+                self.completion_tokens += usage.get("output_tokens", 0)
+                cached = (usage.get("input_token_details") or {}).get("cache_read")
+                if cached is None:
+                    # Older langchain-openai only reports cache hits in the raw OpenAI usage block
+                    cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+                self.cached_prompt_tokens += cached or 0
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# Intents whose answers may be served from the per-agent response cache -> how long (seconds, 0 disables).
+# Bookings are never cached: they change outside this agent (REST API, other workers, the restaurant)
+CACHEABLE_INTENT_TTLS = {
+    "general_inquiry": config.RESPONSE_CACHE_TTL_SECONDS,
+    "check_availability": config.LIVE_DATA_CACHE_TTL_SECONDS,
+}
+
+# Tools that change nothing - a run using any other tool clears the response cache.
+# Kept apart from ParallelToolAgentExecutor.PARALLEL_SAFE_TOOLS on purpose: safe to run concurrently
+# and safe to leave cached answers in place are separate decisions
+READ_ONLY_TOOLS = frozenset({
+    "check_availability_tool",
+    "smart_availability_search_tool",
+    "user_get_bookings_tool",
+    "get_booking_tool",
+})
+
+# Chat history message classes <-> stored type tags
+_SERIALIZERS = {HumanMessage: "human", AIMessage: "ai"}
+_DESERIALIZERS = {"human": HumanMessage, "ai": AIMessage}
+
+# Chat message types -> OpenAI chat completion roles (used by the Batch API path)
+_OPENAI_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+# Opening characters of a first reply checked for a greeting (also how much chat_stream buffers)
+GREETING_CHECK_CHARS = 40
+
+
+class _NullList(list):
+    """List that discards appends"""
+    
+    def append(self, item):
+        pass
+
+
+class _NullDebugInfo(dict):
+    """Stand-in for debug_info when the caller discards it - writes and appends are dropped"""
+    
+    def __setitem__(self, key, value):
+        pass
+    
+    def __missing__(self, key):
+        return _NullList()
+
+
+def _lacks_greeting(response_head: str) -> bool:
+    """Whether a reply's opening text has no greeting"""
+    opening = response_head.lstrip()[:GREETING_CHECK_CHARS].lower()
+    return not any(greeting in opening for greeting in ["hello", "hi", "welcome", "good"])
+
+
+class _TokenQueueCallback(BaseCallbackHandler):
+    """
+    Forwards content tokens to a queue for chat_stream as they are generated.
+    An LLM call stops being forwarded once its chunks carry tool-call deltas - OpenAI tool steps stream
+    tool_call_chunks rather than content, so only the final answer reaches the client.
+    """
+    
+    def __init__(self, tokens: queue.Queue):
+        self.tokens = tokens
+        self._tool_runs = set()  # run ids of LLM calls that turned out to be tool steps
+    
+    def on_llm_new_token(self, token: str, *, chunk=None, run_id=None, **kwargs):
+        if run_id in self._tool_runs:
+            return
+        message = getattr(chunk, "message", None)
+        if message is not None and getattr(message, "tool_call_chunks", None):
+            self._tool_runs.add(run_id)
+            return
+        if token:
+            self.tokens.put(token)
+    
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        self._tool_runs.discard(run_id)
+    
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._tool_runs.discard(run_id)
+
+
+# Worker threads for tool calls that the LLM requested together in one step
+_TOOL_POOL = ContextThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+_tool_batch = threading.local()
+
+# Agent runs behind /chat/stream. A run is not cancelled when the client disconnects - it finishes so the
+# turn is still recorded in the history - so the pool bounds how many such runs can pile up
+_STREAM_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-stream")
+
+# Chat history is written after the reply is ready, off the response path; drained on exit
+_SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-save")
+atexit.register(_SAVE_EXECUTOR.shutdown, wait=True)
+
+
+class ParallelToolAgentExecutor(AgentExecutor):
+    """AgentExecutor that runs the tool calls of one LLM step concurrently when all of them are read-only"""
+    
+    # Tools without side effects - a step mixing in any other tool keeps running sequentially
+    PARALLEL_SAFE_TOOLS: ClassVar[FrozenSet[str]] = frozenset({
+        "check_availability_tool",
+        "smart_availability_search_tool",
+        "user_get_bookings_tool",
+        "get_booking_tool",
+    })
+    
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base implementation yields every planned action before performing any of them,
+        # so the whole batch is known by the time _perform_agent_action is first called
+        _tool_batch.actions = []
+        pending = []
+        try:
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                if isinstance(item, AgentAction):
+                    _tool_batch.actions.append(item)
+                elif isinstance(item, AgentStep) and isinstance(item.observation, Future):
+                    pending.append(item.observation)
+                    continue
+                yield item
+        finally:
+            _tool_batch.actions = []
+        
+        for future in pending:
+            yield future.result()
+    
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        batch = getattr(_tool_batch, "actions", [])
+        if config.PARALLEL_TOOLS and len(batch) > 1 and all(action.tool in self.PARALLEL_SAFE_TOOLS for action in batch):
+            future = _TOOL_POOL.submit(
+                super()._perform_agent_action, name_to_tool_map, color_mapping, agent_action, run_manager
+            )
+            return AgentStep(action=agent_action, observation=future)
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+
+class AgentCore:
+    """Process-wide agent resources shared by every user - the LLM client is created once on first use"""
+    
+    def __init__(self):
+        self._llm = None
+        self._agent = None
+    
+    @property
+    def llm(self):
+        """Shared chat model client"""
+        if self._llm is None:
+            self._llm = self._create_llm()
+        return self._llm
+    
+    def agent(self, tools: List):
+        """
+        Tool-calling agent runnable (prompt | model bound to tool schemas | parser), built once.
+        It only sees tool names and schemas, which are the same for every user; each user's
+        executor runs its own tool instances.
+        """
+        if self._agent is None:
+            self._agent = create_openai_tools_agent(llm=self.llm, tools=tools, prompt=AGENT_PROMPT)
+        return self._agent
+    
+    @staticmethod
+    def _create_llm():
+        """Initialize LLM - Supports Gemini and OpenAI (only the selected provider package is imported)"""
+        if "gemini" in config.OPENAI_MODEL.lower():
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            
+            return ChatGoogleGenerativeAI(
+                google_api_key=config.OPENAI_API_KEY,
+                model=config.OPENAI_MODEL,
+                temperature=0.1
+            )
+        
+        from langchain_openai import ChatOpenAI
+        
+        llm_kwargs = {
+            "openai_api_key": config.OPENAI_API_KEY,
+            "model_name": config.OPENAI_MODEL,
+            "temperature": 0.1,
+            "stream_usage": True  # The agent streams the model, usage is only reported when requested
+        }
+        if config.OPENAI_BASE_URL:
+            llm_kwargs["openai_api_base"] = config.OPENAI_BASE_URL
+        
+        return ChatOpenAI(**llm_kwargs)
+
+
+# Global agent core shared by all BookingAgent instances
+_SHARED_CORE = AgentCore()
 
-Based on the user's input, identify their intent and immediately execute the corresponding tool call. Remember: prioritize using stored user information, only collect missing parameters when necessary, and ensure all API-required parameters are included in the tool call."""
+
+class BookingAgent:
+    """Restaurant Booking AI Agent - Supports intent recognition and guided interaction"""
+    
+    def __init__(self, username: str, core: AgentCore = _SHARED_CORE):
+        self.username = username
+        self.core = core
+        self.user_data = storage.get_user(username)
+        
+        if not self.user_data:
+            raise ValueError(f"User {username} does not exist")
+        
+        # Use a user-aware toolset that automatically fills in stored preferences
+        self.tools = create_user_aware_tools(username)
+        # Tools that call the restaurant booking API (recorded in debug_info["api_calls"])
+        self._api_tool_names = frozenset(
+            t.name for t in self.tools if "booking" in t.name.lower() or "availability" in t.name.lower()
+        )
+        
+        # The executor and chat history are built on first chat, so creating an agent at login stays cheap
+        self._agent_executor = None
+        self._chat_history = None
+        self._persisted_len = 0
+        self._history_summary, self._summarized_len = "", 0
+        self._save_lock = threading.Lock()  # serializes background history saves
+        self._first_reply_done = False  # greeting rule only applies to the first reply of a conversation
+        
+        # Recent answers to read-only questions - cleared whenever a tool changes bookings or the profile
+        # Entries are (ttl, answer) so each answer expires after its own intent's TTL
+        self._response_cache = TLRUCache(maxsize=64, ttu=lambda key, entry, now: now + entry[0])
+    
+    @property
+    def llm(self):
+        """Chat model client shared through the agent core"""
+        return self.core.llm
+    
+    @property
+    def agent_executor(self) -> AgentExecutor:
+        """Agent executor, created on first use"""
+        if self._agent_executor is None:
+            self._agent_executor = self._create_agent_executor()
+        return self._agent_executor
+    
+    @agent_executor.setter
+    def agent_executor(self, value: AgentExecutor):
+        self._agent_executor = value
+    
+    @property
+    def chat_history(self) -> List:
+        """Chat history, loaded from storage on first use"""
+        if self._chat_history is None:
+            self._load_chat_history()
+        return self._chat_history
+    
+    @chat_history.setter
+    def chat_history(self, value: List):
+        self._chat_history = value
+    
+    def _profile_key(self) -> str:
+        """Stable fingerprint of the user's profile"""
+        return json.dumps(self.user_data.get("profile", {}), sort_keys=True, default=str)
+    
+    def _create_agent_executor(self) -> AgentExecutor:
+        """Build the executor around the shared agent - the system prompt is supplied on every run"""
+        self.agent = self.core.agent(self.tools)
+        
+        # Create the executor - fixed configuration to support full workflow
+        return ParallelToolAgentExecutor(
+            agent=self.agent,
+            tools=self.tools,
+            verbose=config.DEBUG,  # Step-by-step stdout logging only when debugging
+            max_iterations=15,  # Increase iterations to support complex flows
+            return_intermediate_steps=True,  # Return intermediate steps for debugging
+            handle_parsing_errors=True  # Improve error handling
+            # Removed early_stopping_method="force" - this is a key fix
+        )
+    
+    def _get_enhanced_system_prompt(self) -> str:
+        """Get the enhanced system prompt - supports intent recognition and intelligent parameter collection"""
+        # Get current date and time
+        now = datetime.now()
+        
+        user_profile = self.user_data.get("profile", {})
+        
+        profile_text = ""
+        marketing_preferences_status = ""
+        if user_profile:
+            profile_parts = ["\n\n【User Profile Information】\n"]
+            profile_parts.extend(f"- {key}: {value}\n" for key, value in user_profile.items() if value)
+            profile_parts.append("\n📋 When creating a booking, please prioritize using this personal information as default values, without repeatedly asking for existing information.")
+            profile_text = "".join(profile_parts)
+            
+            # Analyze marketing preference status
+            marketing_fields = ['ReceiveEmailMarketing', 'ReceiveSMSMarketing', 'ReceiveRestaurantEmailMarketing', 'ReceiveRestaurantSMSMarketing']
+            has_marketing_prefs = any(user_profile.get(field) is not None for field in marketing_fields)
+            
+            if has_marketing_prefs:
+                marketing_parts = ["\n\n🔔 【Marketing Preferences Set】\nUser has set marketing preferences. When creating a booking, use the stored preferences directly without asking again.\nCurrent settings:\n"]
+                marketing_parts.extend(f"- {field}: {user_profile[field]}\n" for field in marketing_fields if field in user_profile)
+                marketing_preferences_status = "".join(marketing_parts)
+            else:
+                marketing_preferences_status = f"\n\n🔔 【Marketing Preferences Not Set】\nUser has not yet set marketing preferences. You need to ask and save them during the first booking."
+        
+        return STATIC_SYSTEM_PROMPT + DYNAMIC_PROMPT_TEMPLATE.format(
+            current_date=now.strftime("%Y-%m-%d"),
+            current_time=now.strftime("%H:%M"),
+            current_weekday=now.strftime("%A"),
+            username=self.username,
+            marketing_preferences_status=marketing_preferences_status,
+            profile_text=profile_text
+        )
     
     
     def _load_chat_history(self):
         """Load chat history"""
         session_data = storage.get_session(self.username)
-        self.chat_history = []
+        self._chat_history = []
         
         for msg in session_data.get("chat_history", []):
-            if msg["type"] == "human":
-                self.chat_history.append(HumanMessage(content=msg["content"]))
-            elif msg["type"] == "ai":
-                self.chat_history.append(AIMessage(content=msg["content"]))
+            message_class = _DESERIALIZERS.get(msg["type"])
+            if message_class is not None:
+                self._chat_history.append(message_class(content=msg["content"]))
+        
+        # Messages up to this index are already stored
+        self._persisted_len = len(self._chat_history)
+        self._first_reply_done = bool(self._chat_history)
+        
+        # Rolling summary of the first _summarized_len messages (sent instead of those messages)
+        self._history_summary = session_data.get("history_summary", "")
+        self._summarized_len = min(session_data.get("summarized_len", 0), len(self._chat_history))
     
     def _save_chat_history(self):
-        """Save chat history"""
-        # Convert to serializable format
-        history_data = []
-        for msg in self.chat_history:
-            if isinstance(msg, HumanMessage):
-                history_data.append({"type": "human", "content": msg.content})
-            elif isinstance(msg, AIMessage):
-                history_data.append({"type": "ai", "content": msg.content})
+        """Save chat history - only messages added since the last save are written"""
+        with self._save_lock:
+            # Snapshot, the chat thread may append while this runs in the background
+            history = list(self.chat_history)
+            if len(history) < self._persisted_len:
+                # History was replaced in memory, rewrite the stored copy from scratch
+                storage.save_session(self.username, {"chat_history": []})
+                self._persisted_len = 0
+                self._history_summary, self._summarized_len = "", 0
+            
+            # Convert to serializable format
+            new_messages = [
+                {"type": _SERIALIZERS[type(msg)], "content": msg.content}
+                for msg in history[self._persisted_len:]
+                if type(msg) in _SERIALIZERS
+            ]
+            
+            storage.append_session_messages(self.username, new_messages)
+            self._persisted_len = len(history)
+    
+    def _prompt_history(self, debug_info: Dict[str, Any]) -> List:
+        """
+        History sent to the LLM: a summary of older turns plus the most recent ones.
+        Older turns are folded into the summary once the unsummarized part reaches
+        2 * MAX_HISTORY_TURNS turns, so the window stays between MAX_HISTORY_TURNS and twice that.
+        """
+        prior = self.chat_history[:-1]
+        window = 2 * config.MAX_HISTORY_TURNS  # messages: one human + one AI per turn
+        if not window:
+            return prior
         
-        storage.save_session(self.username, {"chat_history": history_data})
+        if len(prior) - self._summarized_len >= 2 * window:
+            cutoff = len(prior) - window
+            try:
+                self._history_summary = self._summarize_history(prior[self._summarized_len:cutoff])
+                self._summarized_len = cutoff
+                storage.save_session(self.username, {
+                    "history_summary": self._history_summary,
+                    "summarized_len": self._summarized_len
+                })
+                debug_info["agent_reasoning"].append(f"Summarized conversation history up to message {cutoff}")
+            except Exception as e:
+                # Keep sending the unsummarized turns, summarization is retried next turn
+                debug_info["agent_reasoning"].append(f"History summarization failed: {str(e)}")
+        
+        recent = prior[self._summarized_len:]
+        if not self._history_summary:
+            return recent
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{self._history_summary}")] + recent
+    
+    def _summarize_history(self, messages: List) -> str:
+        """Fold messages into the running history summary with a single LLM call"""
+        transcript = "\n".join(f"{_SERIALIZERS.get(type(msg), 'message')}: {msg.content}" for msg in messages)
+        previous = f"Existing summary:\n{self._history_summary}\n\n" if self._history_summary else ""
+        result = self.llm.invoke(
+            "Summarize this restaurant booking conversation for the assistant's future reference. "
+            "Keep booking references, dates, times, party sizes, names, contact details and any open requests. "
+            f"Be concise.\n\n{previous}New messages:\n{transcript}"
+        )
+        return result.content.strip()
+    
+    @classmethod
+    def chat_batch(cls, inputs: List[Tuple[str, str]], poll_interval: float = 30.0) -> List[str]:
+        """
+        Answer many (username, user_input) turns through the OpenAI Batch API - half the cost, up to 24h latency.
+        For non-interactive single-shot turns only: no tools are called and chat history is not updated.
+        Items the batch could not answer fall back to a regular agent run.
+        """
+        if "gemini" in config.OPENAI_MODEL.lower():
+            raise ValueError("Batch chat requires an OpenAI model")
+        
+        import openai
+        
+        client = openai.OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL or None)
+        agents: Dict[str, "BookingAgent"] = {}
+        
+        # One chat completion request per input, with the same system prompt and history window as a live run
+        lines = []
+        for i, (username, user_input) in enumerate(inputs):
+            agent = agents.get(username) or agents.setdefault(username, cls(username))
+            history = agent.chat_history[agent._summarized_len:]
+            if config.MAX_HISTORY_TURNS:
+                history = history[-2 * config.MAX_HISTORY_TURNS:]
+            messages = [{"role": "system", "content": agent._get_enhanced_system_prompt()}]
+            if agent._history_summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{agent._history_summary}"})
+            messages += [{"role": _OPENAI_ROLES[msg.type], "content": msg.content} for msg in history]
+            messages.append({"role": "user", "content": user_input})
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": config.OPENAI_MODEL, "temperature": 0.1, "messages": messages}
+            }, ensure_ascii=False))
+        
+        batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+        
+        answers: Dict[int, str] = {}
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    answers[int(item["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+        
+        return [
+            answers[i] if i in answers else agents[username].chat(user_input)
+            for i, (username, user_input) in enumerate(inputs)
+        ]
     
     def chat(self, user_input: str) -> str:
         """Handle user input and return response (simple version)"""
-        response, _ = self.chat_with_debug(user_input)
+        response, _ = self._chat_core(user_input, collect_debug=False)
         return response
     
-    def chat_with_debug(self, user_input: str) -> tuple[str, Dict[str, Any]]:
+    def chat_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Handle user input, yielding the final answer as the model generates it.
+        The yielded text adds up to the reply stored in the history (stripped, with the first-reply greeting).
+        The turn runs on _STREAM_EXECUTOR and completes even if the consumer stops iterating.
+        """
+        tokens = queue.Queue()
+        done = object()
+        result = {}
+        # Decided before the worker starts - its post-processing marks the first reply as done
+        first_reply = not self._first_reply_done
+        
+        def run():
+            try:
+                result["response"], _ = self._chat_core(
+                    user_input, callbacks=[_TokenQueueCallback(tokens)], collect_debug=False
+                )
+            finally:
+                tokens.put(done)
+        
+        _STREAM_EXECUTOR.submit(run)
+        
+        text = ""
+        sent = ""
+        # Only a first reply holds back its opening text, until the greeting rule can be applied to it
+        greeting = None if first_reply else ""
+        while (token := tokens.get()) is not done:
+            text += token
+            body = text.lstrip()
+            if greeting is None:
+                if len(body) < GREETING_CHECK_CHARS:
+                    continue
+                greeting = "Hello! " if _lacks_greeting(body) else ""
+            # Trailing whitespace is held back; the stored reply is stripped
+            out = (greeting + body).rstrip()
+            if len(out) > len(sent):
+                yield out[len(sent):]
+                sent = out
+        
+        # Rest of the stored reply: all of it for short, cached or error replies, usually nothing otherwise
+        response = result.get("response", "")
+        if response.startswith(sent):
+            if len(response) > len(sent):
+                yield response[len(sent):]
+        else:
+            # Streamed text that did not end up in the reply (a tool step that sent content) - send the reply itself
+            yield "\n\n" + response
+    
+    def chat_with_debug(self, user_input: str, callbacks: Optional[List[BaseCallbackHandler]] = None) -> tuple[str, Dict[str, Any]]:
         """Handle user input and return response with debug information"""
+        return self._chat_core(user_input, callbacks, collect_debug=True)
+    
+    def _chat_core(self, user_input: str, callbacks: Optional[List[BaseCallbackHandler]] = None,
+                   collect_debug: bool = True) -> tuple[str, Dict[str, Any]]:
+        """Run one turn; debug information is only built when collect_debug is set"""
         start_time = time.time()
-        debug_info = {
-            "agent_steps": [],
-            "api_calls": [],
-            "tool_calls": [],
-            "agent_executed_steps": 0,
-            "agent_reasoning": [],
-            "decisions": [],
-            "performance": {}
-        }
+        if collect_debug:
+            debug_info = {
+                "agent_steps": [],
+                "api_calls": [],
+                "tool_calls": [],
+                "agent_executed_steps": 0,
+                "agent_reasoning": [],
+                "decisions": [],
+                "performance": {}
+            }
+        else:
+            debug_info = _NullDebugInfo()
         
         try:
             # Refresh user data to get latest profile information
@@ -281,37 +722,46 @@ Based on the user's input, identify their intent and immediately execute the cor
             self.chat_history.append(HumanMessage(content=user_input))
             
             # Track agent reasoning process
-            debug_info["agent_reasoning"].append(f"Processing user input: '{user_input}'")
-            debug_info["agent_reasoning"].append(f"Current user: {self.username}")
-            debug_info["agent_reasoning"].append(f"Available tools: {[tool.name for tool in self.tools]}")
+            if collect_debug:
+                debug_info["agent_reasoning"].append(f"Processing user input: '{user_input}'")
+                debug_info["agent_reasoning"].append(f"Current user: {self.username}")
+                debug_info["agent_reasoning"].append(f"Available tools: {[tool.name for tool in self.tools]}")
             
             # Analyze user intent
             intent_analysis = self._analyze_user_intent(user_input)
-            debug_info["decisions"].append({
-                "decision": f"Intent identified as: {intent_analysis['intent']}",
-                "reasoning": f"Based on keywords: {intent_analysis['keywords']}, confidence: {intent_analysis['confidence']}"
-            })
+            if collect_debug:
+                debug_info["decisions"].append({
+                    "decision": f"Intent identified as: {intent_analysis['intent']}",
+                    "reasoning": f"Based on keywords: {intent_analysis['keywords']}, confidence: {intent_analysis['confidence']}"
+                })
             
             llm_start_time = time.time()
+            token_usage = TokenUsageCallback()
             
             # Execute agent
-            result = self.agent_executor.invoke({
-                "input": user_input,
-                "chat_history": self.chat_history[:-1]
-            })
+            result = self._invoke_agent(
+                user_input, intent_analysis["intent"], [token_usage, *(callbacks or [])], debug_info
+            )
             
             llm_end_time = time.time()
             
             response = result["output"]
+            steps = result.get("intermediate_steps") or []
+            
+            # If profile updated, refresh user data for the next turn
+            if any(step[0].tool == "update_user_profile_tool" for step in steps):
+                self._refresh_agent_prompt()
             
             # Collect debug information
-            if result.get("intermediate_steps"):
-                debug_info["agent_executed_steps"] = len(result['intermediate_steps'])
-                debug_info["agent_reasoning"].append(f"Agent executed {len(result['intermediate_steps'])} tool calls")
+            if not collect_debug:
+                tool_start_time = tool_end_time = llm_end_time
+            elif steps:
+                debug_info["agent_executed_steps"] = len(steps)
+                debug_info["agent_reasoning"].append(f"Agent executed {len(steps)} tool calls")
                 
                 tool_start_time = time.time()
                 
-                for i, step in enumerate(result["intermediate_steps"]):
+                for i, step in enumerate(steps):
                     step_info = {
                         "step": i+1,
                         "tool": step[0].tool,
@@ -330,7 +780,7 @@ Based on the user's input, identify their intent and immediately execute the cor
                     })
                     
                     # If it's a booking API call tool, record detailed information
-                    if "booking" in step[0].tool.lower() or "availability" in step[0].tool.lower():
+                    if step[0].tool in self._api_tool_names:
                         api_response = step[1] if len(step) > 1 else "No response"
                         debug_info["api_calls"].append({
                             "tool": step[0].tool,
@@ -339,9 +789,7 @@ Based on the user's input, identify their intent and immediately execute the cor
                         })
                         debug_info["agent_reasoning"].append(f"External API call made to restaurant booking system")
                         
-                    # If profile updated, regenerate system prompt
                     if step[0].tool == "update_user_profile_tool":
-                        self._refresh_agent_prompt()
                         debug_info["agent_reasoning"].append("User profile updated, refreshing agent context")
                         
                 tool_end_time = time.time()
@@ -361,8 +809,11 @@ Based on the user's input, identify their intent and immediately execute the cor
             # Add AI response to history
             self.chat_history.append(AIMessage(content=response))
             
-            # Save chat history
-            self._save_chat_history()
+            # Save chat history in the background - the response is already complete
+            _SAVE_EXECUTOR.submit(self._save_chat_history)
+            
+            if not collect_debug:
+                return response, debug_info
             
             end_time = time.time()
             
@@ -371,7 +822,8 @@ Based on the user's input, identify their intent and immediately execute the cor
                 "total_time": round((end_time - start_time) * 1000, 2),
                 "llm_time": round((llm_end_time - llm_start_time) * 1000, 2),
                 "tool_time": round((tool_end_time - tool_start_time) * 1000, 2),
-                "tokens_used": "N/A"  # Could be enhanced with actual token counting
+                "tokens_used": token_usage.total_tokens or "N/A",
+                "cached_prompt_tokens": token_usage.cached_prompt_tokens
             }
             
             debug_info["agent_reasoning"].append(f"Response generated successfully in {debug_info['performance']['total_time']}ms")
@@ -393,31 +845,65 @@ Based on the user's input, identify their intent and immediately execute the cor
             
             return error_msg, debug_info
     
+    def _invoke_agent(self, user_input: str, intent: str, callbacks: List[BaseCallbackHandler],
+                      debug_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the agent executor, answering repeated read-only questions from the response cache"""
+        cache_key = None
+        cache_ttl = CACHEABLE_INTENT_TTLS.get(intent, 0)
+        if cache_ttl > 0:
+            cache_key = self._response_cache_key(user_input)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                debug_info["cache_hit"] = True
+                debug_info["agent_reasoning"].append("Answered from response cache")
+                return {"output": cached[1], "intermediate_steps": []}
+        
+        result = self.agent_executor.invoke({
+            "system_prompt": self._get_enhanced_system_prompt(),
+            "input": user_input,
+            "chat_history": self._prompt_history(debug_info)
+        }, config={"callbacks": callbacks})
+        
+        tools_used = {step[0].tool for step in result.get("intermediate_steps", [])}
+        if tools_used - READ_ONLY_TOOLS:
+            # Bookings or profile changed, earlier answers may be stale
+            self._response_cache.clear()
+        elif cache_key is not None:
+            if tools_used:
+                # The answer was built from live restaurant data
+                cache_ttl = min(cache_ttl, config.LIVE_DATA_CACHE_TTL_SECONDS)
+            if cache_ttl > 0:
+                self._response_cache[cache_key] = (cache_ttl, result["output"])
+        
+        return result
+    
+    def _response_cache_key(self, user_input: str) -> str:
+        """Hash of everything the answer depends on: date, model, profile, recent history and the input"""
+        payload = {
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "model": config.OPENAI_MODEL,
+            "profile": self._profile_key(),
+            "history": [(msg.type, msg.content) for msg in self.chat_history[-6:-1]],
+            "input": user_input
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    
     def _analyze_user_intent(self, user_input: str) -> Dict[str, Any]:
         """Analyze user intent from input"""
-        user_input_lower = user_input.lower()
-        
-        # Intent keywords mapping
-        intent_keywords = {
-            "check_availability": ["check", "available", "free", "open", "time", "when", "any", "query", "see", "availability", "slot"],
-            "create_booking": ["book", "reserve", "table", "want", "need", "make", "order", "get"],
-            "view_bookings": ["show", "view", "my", "bookings", "reservations", "check booking"],
-            "modify_booking": ["change", "modify", "update", "edit", "move", "adjust", "switch"],
-            "cancel_booking": ["cancel", "remove", "delete", "don't want", "revoke", "not going"]
-        }
+        matched = frozenset(_INTENT_PATTERN.findall(user_input.lower()))
         
-        # Calculate intent scores
+        # Calculate intent scores (one point per distinct keyword), keeping INTENT_KEYWORDS order for ties
         intent_scores = {}
-        for intent, keywords in intent_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in user_input_lower)
-            if score > 0:
-                intent_scores[intent] = score
+        for intent, keywords in _INTENT_KEYWORD_SETS.items():
+            hits = len(matched & keywords)
+            if hits:
+                intent_scores[intent] = hits
         
         # Determine primary intent
         if intent_scores:
             primary_intent = max(intent_scores, key=intent_scores.get)
-            confidence = intent_scores[primary_intent] / len(intent_keywords[primary_intent])
-            matched_keywords = [kw for kw in intent_keywords[primary_intent] if kw in user_input_lower]
+            confidence = intent_scores[primary_intent] / len(INTENT_KEYWORDS[primary_intent])
+            matched_keywords = [kw for kw in INTENT_KEYWORDS[primary_intent] if kw in matched]
         else:
             primary_intent = "general_inquiry"
             confidence = 0.5
@@ -436,66 +922,39 @@ Based on the user's input, identify their intent and immediately execute the cor
         response = response.strip()
         
         # Ensure proper greeting for first interaction
-        if len(self.chat_history) <= 2:  # User message + AI response
-            if not any(greeting in response.lower() for greeting in ["hello", "hi", "welcome", "good"]):
-                response = f"Hello! {response}"
+        if self._needs_greeting(response):
+            response = f"Hello! {response}"
+        self._first_reply_done = True
         
         return response
     
+    def _needs_greeting(self, response_head: str) -> bool:
+        """Whether the first reply of a conversation lacks a greeting in its opening text"""
+        return not self._first_reply_done and _lacks_greeting(response_head)
+    
     def _refresh_agent_prompt(self):
-        """Refresh agent prompt with updated user data"""
+        """Refresh user data - the system prompt is rendered from it on every run, so the agent is kept"""
         self.user_data = storage.get_user(self.username)
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", self._get_enhanced_system_prompt()),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad")
-        ])
-        
-        # Recreate agent with new prompt
-        self.agent = create_openai_tools_agent(self.llm, self.tools, self.prompt)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=10,
-            max_execution_time=60,
-            return_intermediate_steps=True
-        )
     
     def clear_history(self):
         """Clear chat history"""
-        self.chat_history = []
-        storage.save_session(self.username, {"chat_history": []})
+        with self._save_lock:
+            self.chat_history = []
+            self._persisted_len = 0
+            self._history_summary, self._summarized_len = "", 0
+            self._first_reply_done = False
+            storage.save_session(self.username, {"chat_history": []})
         
     def get_user_profile(self) -> Dict[str, Any]:
         """Get user profile"""
         return self.user_data.get("profile", {})
     
     def update_user_profile(self, profile: Dict[str, Any]):
-        """Update user profile and re-initialize agent"""
+        """Update user profile"""
         storage.update_user_profile(self.username, profile)
-        self.user_data = storage.get_user(self.username)
-        
-        # Re-create agent to update user info in system prompt
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", self._get_enhanced_system_prompt()),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad")
-        ])
         
-        self.agent = create_openai_tools_agent(self.llm, self.tools, self.prompt)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=10,
-            max_execution_time=60,
-            return_intermediate_steps=True
-        )
+        # The next run renders the system prompt with the new profile
+        self._refresh_agent_prompt()
     
     def get_available_commands(self) -> List[str]:
         """Get available command list - for help function"""
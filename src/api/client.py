@@ -2,12 +2,47 @@
 Restaurant API Client - Handles communication with the external mock server.
 This module acts as an Anti-Corruption Layer, strictly isolating the internal system from the external API.
 """
-import requests
-from typing import Dict, Any, Optional
-from datetime import date, time
+import asyncio
+import atexit
+import importlib.util
+import threading
+import weakref
+from urllib.parse import quote_plus
+import httpx
+from typing import Dict, Any, List, Optional, Tuple, Type, TypeVar, Union
+from pydantic import BaseModel
 from ..config import config
 from . import schemas
-import json
+import orjson
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# HTTP/2 (multiplexing, header compression) needs the optional h2 package; negotiated over TLS only
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Form keys for customer fields, built once from the CustomerInfo schema
+_CUSTOMER_KEY_MAP = {field: f"Customer[{field}]" for field in schemas.CustomerInfo.model_fields}
+# The same keys already percent-encoded for the form body
+_QUOTED_FORM_KEYS = {key: quote_plus(key) for key in _CUSTOMER_KEY_MAP.values()}
+_FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+def _encode_form_value(value: Any) -> str:
+    """Form value as text - booleans lowercase, None empty (same rules as httpx's own encoder)"""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return "" if value is None else str(value)
+
+
+def _encode_form(data: Dict[str, Any]) -> str:
+    """URL-encode a flat form in one pass, reusing pre-quoted customer keys"""
+    return "&".join(
+        f"{_QUOTED_FORM_KEYS.get(key) or quote_plus(key)}={quote_plus(_encode_form_value(value))}"
+        for key, value in data.items()
+    )
+
 
 class RestaurantAPIError(Exception):
     """Custom Restaurant API error to encapsulate all exceptions from the API."""
@@ -20,112 +55,222 @@ class RestaurantAPIClient:
     """Restaurant API client, responsible for all HTTP communication and data formatting."""
     
     def __init__(self):
-        self.base_url = f"{config.RESTAURANT_API_BASE_URL}/api/ConsumerApi/v1/Restaurant/{config.RESTAURANT_NAME}"
+        self.base_url = config.BASE_URL_PREFIX
         self.headers = {
             "Authorization": f"Bearer {config.RESTAURANT_API_TOKEN}",
+            # Request bodies are always pre-encoded forms
+            "Content-Type": _FORM_CONTENT_TYPE,
         }
+        
+        # One pooled keep-alive client for all calls, so repeated calls reuse the TCP/TLS connection.
+        # Pool limits and HTTP/2 belong on the transport - httpx ignores the client-level ones when a transport is given
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=10.0,
+            # Retries failed connection attempts only - a request that reached the server is never resent
+            transport=httpx.HTTPTransport(
+                retries=2,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=config.RESTAURANT_API_MAX_CONNECTIONS,
+                    max_keepalive_connections=10,
+                    keepalive_expiry=30
+                )
+            )
+        )
+        atexit.register(self.close)
+        
+        # httpx clients are bound to the event loop they were created on, so keep one per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        # Bulk calls from synchronous code all run on one background event loop, so its async client
+        # and connection pool live as long as this client instead of being rebuilt for every call
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+    
+    def close(self):
+        """Close pooled connections."""
+        self.client.close()
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
     
     def _flatten_customer_data(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         [Core Implementation] Flattens the customer data dictionary into 'Customer[Key]': 'Value' format
         to meet the 'application/x-www-form-urlencoded' requirement.
         """
-        if not customer_data:
-            return {}
-        
-        flat_data = {}
-        for key, value in customer_data.items():
-            if value is not None:
-                if isinstance(value, bool):
-                    flat_data[f"Customer[{key}]"] = str(value).lower()
-                else:
-                    flat_data[f"Customer[{key}]"] = str(value)
-        return flat_data
-
-    def _convert_date_time_to_strings(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            (_CUSTOMER_KEY_MAP.get(key) or f"Customer[{key}]"): ("true" if value is True else "false" if value is False else str(value))
+            for key, value in customer_data.items() if value is not None
+        }
+
+    def _build_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Tuple[str, str, Optional[str]]:
+        """Resolve the method, URL (relative to the clients' base_url) and encoded form body of a call (shared by the sync and async paths)."""
+        return method, endpoint, (_encode_form(data) if data is not None else None)
+
+    @staticmethod
+    def _parse_response(response: httpx.Response, response_model: Optional[Type[ModelT]] = None):
         """
-        Converts date and time objects to string format for the external API.
+        Decode a successful response body.
+        With a response_model the raw bytes are validated straight into the model (pydantic-core parses the JSON),
+        skipping the intermediate dict.
         """
-        converted_data = data.copy()
-        
-        # Convert date object
-        if 'VisitDate' in converted_data and isinstance(converted_data['VisitDate'], date):
-            converted_data['VisitDate'] = converted_data['VisitDate'].isoformat()
-        
-        # Convert time object
-        if 'VisitTime' in converted_data and isinstance(converted_data['VisitTime'], time):
-            converted_data['VisitTime'] = converted_data['VisitTime'].isoformat()
-            
-        return converted_data
+        if not response.content:
+            data = {"status": "success", "message": "Operation successful"}
+            return response_model.model_validate(data) if response_model else data
+        if response_model:
+            return response_model.model_validate_json(response.content)
+        return orjson.loads(response.content)
 
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    @staticmethod
+    def _error_detail(response: httpx.Response) -> str:
+        """Extract the error detail from a failed response."""
+        try:
+            return orjson.loads(response.content).get("detail", response.text)
+        except orjson.JSONDecodeError:
+            return response.text
+
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None,
+                      response_model: Optional[Type[ModelT]] = None) -> Union[Dict[str, Any], ModelT]:
         """Unified HTTP request method with robust error handling."""
-        url = f"{self.base_url}{endpoint}"
+        method, url, body = self._build_request(method, endpoint, data)
         
         try:
-            response = requests.request(method, url, headers=self.headers, data=data, timeout=10)
+            response = self.client.request(method, url, content=body)
             response.raise_for_status()
-            return response.json() if response.content else {"status": "success", "message": "Operation successful"}
-        except requests.exceptions.HTTPError as e:
-            try:
-                error_details = e.response.json().get("detail", e.response.text)
-            except json.JSONDecodeError:
-                error_details = e.response.text
-            raise RestaurantAPIError(e.response.status_code, error_details) from e
-        except requests.exceptions.RequestException as e:
+            return self._parse_response(response, response_model)
+        except httpx.HTTPStatusError as e:
+            raise RestaurantAPIError(e.response.status_code, self._error_detail(e.response)) from e
+        except httpx.RequestError as e:
+            raise RestaurantAPIError(0, f"Network connection error: {e}") from e
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Async client for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=10,
+                limits=httpx.Limits(
+                    max_connections=config.RESTAURANT_API_MAX_CONNECTIONS,
+                    max_keepalive_connections=20
+                )
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """Close the async client of the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def _make_request_async(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None,
+                                  response_model: Optional[Type[ModelT]] = None) -> Union[Dict[str, Any], ModelT]:
+        """Async counterpart of _make_request."""
+        method, url, body = self._build_request(method, endpoint, data)
+        
+        try:
+            response = await self._get_async_client().request(method, url, content=body)
+            response.raise_for_status()
+            return self._parse_response(response, response_model)
+        except httpx.HTTPStatusError as e:
+            raise RestaurantAPIError(e.response.status_code, self._error_detail(e.response)) from e
+        except httpx.RequestError as e:
             raise RestaurantAPIError(0, f"Network connection error: {e}") from e
 
     def check_availability(self, request: schemas.AvailabilityRequest) -> schemas.AvailabilityResponse:
         """Check for available time slots."""
         endpoint = "/AvailabilitySearch"
         
-        # Convert Pydantic model to dictionary and handle date/time
-        data = request.model_dump()
-        data = self._convert_date_time_to_strings(data)
+        # Convert Pydantic model to dictionary (JSON mode emits ISO date/time strings)
+        data = request.model_dump(mode='json')
+        
+        return self._make_request("POST", endpoint, data=data, response_model=schemas.AvailabilityResponse)
+
+    async def check_availability_async(self, request: schemas.AvailabilityRequest) -> schemas.AvailabilityResponse:
+        """Check for available time slots (async)."""
+        data = request.model_dump(mode='json')
+        return await self._make_request_async("POST", "/AvailabilitySearch", data=data, response_model=schemas.AvailabilityResponse)
+
+    @staticmethod
+    async def _gather_bounded(coros) -> List[Any]:
+        """Await coroutines concurrently, at most RESTAURANT_API_MAX_CONCURRENT_REQUESTS at a time; failures are returned as their exception, in order."""
+        semaphore = asyncio.Semaphore(config.RESTAURANT_API_MAX_CONCURRENT_REQUESTS)
         
-        response_data = self._make_request("POST", endpoint, data=data)
-        return schemas.AvailabilityResponse.model_validate(response_data)
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+        
+        return await asyncio.gather(*(bounded(coro) for coro in coros), return_exceptions=True)
+
+    async def check_availability_bulk(self, availability_requests: List[schemas.AvailabilityRequest]) -> List[Union[schemas.AvailabilityResponse, Exception]]:
+        """Check several dates concurrently; failed checks are returned as their exception, in request order."""
+        return await self._gather_bounded([self.check_availability_async(r) for r in availability_requests])
+
+    def check_availability_bulk_sync(self, availability_requests: List[schemas.AvailabilityRequest]) -> List[Union[schemas.AvailabilityResponse, Exception]]:
+        """Blocking wrapper around check_availability_bulk for synchronous callers such as tools."""
+        return self._run_blocking(self.check_availability_bulk(availability_requests))
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop for bulk calls from synchronous code, started on a daemon thread on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="restaurant-api-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _run_blocking(self, coro):
+        """Run a bulk coroutine to completion from synchronous code on the background event loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self._background_loop()).result()
 
     def create_booking(self, request: schemas.BookingRequest) -> schemas.BookingResponse:
         """Create a new booking."""
         endpoint = "/BookingWithStripeToken"
         
-        # Separate customer data from booking data
-        booking_data = request.model_dump(exclude={'Customer'}, exclude_none=True)
-        customer_data = request.Customer.model_dump(exclude_none=True) if request.Customer else {}
-
-        # Convert date/time format
-        booking_data = self._convert_date_time_to_strings(booking_data)
-
-        # Flatten customer data
-        flat_customer_data = self._flatten_customer_data(customer_data)
-        final_data = {**booking_data, **flat_customer_data}
+        # Booking fields, then customer fields flattened straight from the model's values (no nested dump)
+        final_data = request.model_dump(mode='json', exclude={'Customer'}, exclude_none=True)
+        if request.Customer:
+            final_data.update(self._flatten_customer_data(vars(request.Customer)))
         
-        response_data = self._make_request("POST", endpoint, data=final_data)
-        return schemas.BookingResponse.model_validate(response_data)
+        return self._make_request("POST", endpoint, data=final_data, response_model=schemas.BookingResponse)
 
     def get_booking(self, booking_reference: str) -> schemas.BookingDetailsResponse:
         """Get booking details."""
         endpoint = f"/Booking/{booking_reference}"
-        response_data = self._make_request("GET", endpoint)
-        return schemas.BookingDetailsResponse.model_validate(response_data)
+        return self._make_request("GET", endpoint, response_model=schemas.BookingDetailsResponse)
+
+    async def get_booking_async(self, booking_reference: str) -> schemas.BookingDetailsResponse:
+        """Get booking details (async)."""
+        return await self._make_request_async("GET", f"/Booking/{booking_reference}", response_model=schemas.BookingDetailsResponse)
+
+    async def get_bookings_bulk(self, booking_references: List[str]) -> List[Union[schemas.BookingDetailsResponse, Exception]]:
+        """Fetch several bookings concurrently; failed lookups are returned as their exception, in reference order."""
+        return await self._gather_bounded([self.get_booking_async(ref) for ref in booking_references])
+
+    def get_bookings_bulk_sync(self, booking_references: List[str]) -> List[Union[schemas.BookingDetailsResponse, Exception]]:
+        """Blocking wrapper around get_bookings_bulk for synchronous callers such as tools."""
+        return self._run_blocking(self.get_bookings_bulk(booking_references))
 
     def update_booking(self, booking_reference: str, request: schemas.BookingUpdateRequest) -> schemas.BookingUpdateResponse:
         """Update a booking."""
         endpoint = f"/Booking/{booking_reference}"
         
-        # Get data and convert date/time format
-        data = request.model_dump(exclude_none=True)
-        data = self._convert_date_time_to_strings(data)
+        # Get data with date/time as ISO strings
+        data = request.model_dump(mode='json', exclude_none=True)
             
-        response_data = self._make_request("PATCH", endpoint, data=data)
-        return schemas.BookingUpdateResponse.model_validate(response_data)
+        return self._make_request("PATCH", endpoint, data=data, response_model=schemas.BookingUpdateResponse)
 
     def cancel_booking(self, request: schemas.CancelBookingRequest) -> schemas.CancelBookingResponse:
         """Cancel a booking."""
         endpoint = f"/Booking/{request.bookingReference}/Cancel"
         data = request.model_dump()
-        response_data = self._make_request("POST", endpoint, data=data)
-        return schemas.CancelBookingResponse.model_validate(response_data)
+        return self._make_request("POST", endpoint, data=data, response_model=schemas.CancelBookingResponse)
 
 api_client = RestaurantAPIClient()
\ No newline at end of file
@@ -6,6 +6,21 @@ from typing import Optional, List, Dict, Any
 from datetime import date, time
 import re
 
+# Validation patterns and allowed values, compiled/built once at import
+_PHONE_RE = re.compile(r'^[\d\s\-\(\)\+]+$')
+_BOOKING_REF_RE = re.compile(r'^[A-Z0-9]{3,20}$')
+_TITLES = ('Mr', 'Mrs', 'Ms', 'Dr', 'Prof', 'Sir', 'Lady')
+_CHANNELS = ('ONLINE', 'PHONE', 'WALK_IN', 'PARTNER')
+_VALID_TITLE_SET = frozenset(_TITLES)
+_VALID_CHANNEL_SET = frozenset(_CHANNELS)
+# Error messages list the values in their documented order
+_TITLES_STR = ', '.join(_TITLES)
+_CHANNELS_STR = ', '.join(_CHANNELS)
+
+# Business hours are 11:00-23:00
+_OPENING_TIME = time(11, 0)
+_CLOSING_TIME = time(23, 0)
+
 
 class CustomerInfo(BaseModel):
     """Customer information model - full version supporting all marketing parameters."""
@@ -36,7 +51,7 @@ class CustomerInfo(BaseModel):
         if v is None or v == "":
             return v
         # Basic phone number format validation - allows only digits, spaces, hyphens, parentheses, plus sign
-        if not re.match(r'^[\d\s\-\(\)\+]+$', v):
+        if not _PHONE_RE.match(v):
             raise ValueError("Invalid phone number format")
         return v
 
@@ -46,9 +61,8 @@ class CustomerInfo(BaseModel):
         """Validate title format."""
         if v is None or v == "":
             return v
-        valid_titles = ['Mr', 'Mrs', 'Ms', 'Dr', 'Prof', 'Sir', 'Lady']
-        if v not in valid_titles:
-            raise ValueError(f"Title must be one of: {', '.join(valid_titles)}")
+        if v not in _VALID_TITLE_SET:
+            raise ValueError(f"Title must be one of: {_TITLES_STR}")
         return v
 
 
@@ -62,8 +76,7 @@ class AvailabilityRequest(BaseModel):
     @classmethod
     def validate_visit_date(cls, v):
         """Validate that the visit date is not in the past."""
-        from datetime import date as date_today
-        if v < date_today.today():
+        if v < date.today():
             raise ValueError("Visit date cannot be in the past")
         return v
 
@@ -71,10 +84,10 @@ class AvailabilityRequest(BaseModel):
     @classmethod
     def validate_channel_code(cls, v):
         """Validate the booking channel."""
-        valid_channels = ['ONLINE', 'PHONE', 'WALK_IN', 'PARTNER']
-        if v.upper() not in valid_channels:
-            raise ValueError(f"Booking channel must be one of: {', '.join(valid_channels)}")
-        return v.upper()
+        code = v.upper()
+        if code not in _VALID_CHANNEL_SET:
+            raise ValueError(f"Booking channel must be one of: {_CHANNELS_STR}")
+        return code
 
 
 class BookingRequest(BaseModel):
@@ -92,8 +105,7 @@ class BookingRequest(BaseModel):
     @classmethod
     def validate_visit_date(cls, v):
         """Validate that the visit date is not in the past."""
-        from datetime import date as date_today
-        if v < date_today.today():
+        if v < date.today():
             raise ValueError("Visit date cannot be in the past")
         return v
 
@@ -101,12 +113,7 @@ class BookingRequest(BaseModel):
     @classmethod
     def validate_visit_time(cls, v):
         """Validate that the visit time is within business hours."""
-        # Assuming business hours are 11:00-23:00
-        from datetime import time as time_obj
-        opening_time = time_obj(11, 0)
-        closing_time = time_obj(23, 0)
-        
-        if not (opening_time <= v <= closing_time):
+        if not (_OPENING_TIME <= v <= _CLOSING_TIME):
             raise ValueError("Visit time must be within business hours (11:00-23:00)")
         return v
 
@@ -114,10 +121,10 @@ class BookingRequest(BaseModel):
     @classmethod
     def validate_channel_code(cls, v):
         """Validate the booking channel."""
-        valid_channels = ['ONLINE', 'PHONE', 'WALK_IN', 'PARTNER']
-        if v.upper() not in valid_channels:
-            raise ValueError(f"Booking channel must be one of: {', '.join(valid_channels)}")
-        return v.upper()
+        code = v.upper()
+        if code not in _VALID_CHANNEL_SET:
+            raise ValueError(f"Booking channel must be one of: {_CHANNELS_STR}")
+        return code
 
 
 class BookingUpdateRequest(BaseModel):
@@ -134,8 +141,7 @@ class BookingUpdateRequest(BaseModel):
         """Validate that the visit date is not in the past."""
         if v is None:
             return v
-        from datetime import date as date_today
-        if v < date_today.today():
+        if v < date.today():
             raise ValueError("Visit date cannot be in the past")
         return v
 
@@ -145,12 +151,7 @@ class BookingUpdateRequest(BaseModel):
         """Validate that the visit time is within business hours."""
         if v is None:
             return v
-        # Assuming business hours are 11:00-23:00
-        from datetime import time as time_obj
-        opening_time = time_obj(11, 0)
-        closing_time = time_obj(23, 0)
-        
-        if not (opening_time <= v <= closing_time):
+        if not (_OPENING_TIME <= v <= _CLOSING_TIME):
             raise ValueError("Visit time must be within business hours (11:00-23:00)")
         return v
 
@@ -165,7 +166,7 @@ class CancelBookingRequest(BaseModel):
     @classmethod
     def validate_booking_reference(cls, v):
         """Validate booking reference format."""
-        if not re.match(r'^[A-Z0-9]{3,20}$', v):
+        if not _BOOKING_REF_RE.match(v):
             raise ValueError("Booking reference must be 3-20 uppercase letters and numbers")
         return v
 
@@ -244,7 +245,7 @@ class CancelBookingResponse(BaseModel):
     cancellation_reason_id: int = Field(..., ge=1, le=5, description="Cancellation reason ID")
     cancellation_reason: str = Field(..., description="Cancellation reason")
     status: str = Field(..., description="Status")
-    cancelled_at: str = Field(..., description="Cancellation time")
+    cancelled_at: Optional[str] = Field(None, description="Cancellation time")
     message: str = Field(..., description="Message")
 
 
@@ -2,14 +2,16 @@
 Configuration Management Module - Unified management of all configuration items
 """
 import os
+from dataclasses import dataclass, field
 from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env
 load_dotenv()
 
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Application configuration class"""
+    """Application configuration class (read once from the environment, immutable afterwards)"""
     
     # LLM Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "").strip('"')
@@ -20,23 +22,55 @@ class Config:
     RESTAURANT_API_BASE_URL: str = os.getenv("RESTAURANT_API_BASE_URL", "http://localhost:8547")
     RESTAURANT_API_TOKEN: str = os.getenv("RESTAURANT_API_TOKEN", "")
     RESTAURANT_NAME: str = os.getenv("RESTAURANT_NAME", "TheHungryUnicorn")
+    # Upper bound on concurrent connections to the restaurant API per client pool
+    RESTAURANT_API_MAX_CONNECTIONS: int = int(os.getenv("RESTAURANT_API_MAX_CONNECTIONS", "20"))
+    # Upper bound on requests a single bulk call (e.g. a multi-day availability search) keeps in flight
+    RESTAURANT_API_MAX_CONCURRENT_REQUESTS: int = int(os.getenv("RESTAURANT_API_MAX_CONCURRENT_REQUESTS", "5"))
+    # Restaurant endpoint prefix, derived from the two settings above
+    BASE_URL_PREFIX: str = field(init=False)
     
     # Agent Behavior Configuration
     MAX_AVAILABILITY_SEARCH_DAYS: int = int(os.getenv("MAX_AVAILABILITY_SEARCH_DAYS", "20"))
     AGENT_MAX_ITERATIONS: int = int(os.getenv("AGENT_MAX_ITERATIONS", "15"))
+    # Recent turns sent verbatim to the LLM, older turns are sent as a rolling summary (0 sends everything)
+    MAX_HISTORY_TURNS: int = int(os.getenv("MAX_HISTORY_TURNS", "12"))
+    # Run read-only tool calls requested in the same LLM step concurrently
+    PARALLEL_TOOLS: bool = os.getenv("PARALLEL_TOOLS", "true").lower() == "true"
+    # Reuse answers to repeated general questions for this many seconds (0 disables)
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+    # Shorter reuse window for answers built from live data such as availability (0 disables)
+    LIVE_DATA_CACHE_TTL_SECONDS: int = int(os.getenv("LIVE_DATA_CACHE_TTL_SECONDS", "30"))
+    
+    # Print agent executor steps to stdout
+    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
     
     # Data storage configuration
     DATA_PATH: str = os.getenv("DATA_PATH", "data")
+
+    # Session store configuration (falls back to in-process storage when REDIS_URL is empty)
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    RESET_CODE_TTL_SECONDS: int = int(os.getenv("RESET_CODE_TTL_SECONDS", "600"))
     
-    @classmethod
-    def validate(cls) -> None:
+    # bcrypt cost for new password hashes (existing hashes keep the cost they were created with)
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "BASE_URL_PREFIX",
+            f"{self.RESTAURANT_API_BASE_URL}/api/ConsumerApi/v1/Restaurant/{self.RESTAURANT_NAME}"
+        )
+
+    def validate(self) -> None:
         """Validate that required configuration exists"""
-        if not cls.OPENAI_API_KEY:
+        if not self.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is required")
-        if not cls.RESTAURANT_API_TOKEN:
+        if not self.RESTAURANT_API_TOKEN:
             raise ValueError("RESTAURANT_API_TOKEN is required")
-        if cls.MAX_AVAILABILITY_SEARCH_DAYS <= 0 or cls.MAX_AVAILABILITY_SEARCH_DAYS > 365:
+        if self.MAX_AVAILABILITY_SEARCH_DAYS <= 0 or self.MAX_AVAILABILITY_SEARCH_DAYS > 365:
             raise ValueError("MAX_AVAILABILITY_SEARCH_DAYS must be between 1 and 365")
+        if self.RESTAURANT_API_MAX_CONCURRENT_REQUESTS <= 0:
+            raise ValueError("RESTAURANT_API_MAX_CONCURRENT_REQUESTS must be at least 1")
 
 # Global configuration instance
 config = Config() 
\ No newline at end of file
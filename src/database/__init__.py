@@ -1,7 +1,7 @@
 """
 数据库模块
 """
-from .models import User, Booking, ChatSession, db_manager
+from .models import User, Booking, ChatSession, ChatMessage, db_manager
 from .crud import crud
 
-__all__ = ['User', 'Booking', 'ChatSession', 'db_manager', 'crud'] 
\ No newline at end of file
+__all__ = ['User', 'Booking', 'ChatSession', 'ChatMessage', 'db_manager', 'crud'] 
\ No newline at end of file
@@ -1,45 +1,146 @@
 """
 Database CRUD Operations
 """
-import json
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Dict, Any
+from cachetools import TTLCache
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload
 from passlib.context import CryptContext
-from .models import User, Booking, ChatSession, db_manager
+from .models import User, Booking, ChatSession, ChatMessage, db_manager
+from ..config import config
 
 # Password encryption context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=config.BCRYPT_ROUNDS)
+# Resolve the bcrypt backend now rather than on the first login/registration
+pwd_context.handler("bcrypt").get_backend()
+
+# Hot lookups are built once so every call reuses the same statement and its compiled form
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+USER_BY_EMAIL = select(User).where(User.email_idx == bindparam("email"))
+PASSWORD_HASH_BY_USERNAME = select(User.hashed_password).where(User.username == bindparam("username"))
+BOOKING_BY_REF = select(Booking).where(Booking.booking_reference == bindparam("ref"))
+BOOKINGS_BY_USER = select(Booking).where(Booking.user_id == bindparam("user_id"))
+CHAT_SESSION_BY_USER = select(ChatSession).where(ChatSession.user_id == bindparam("user_id"))
+USER_WITH_BOOKINGS = USER_BY_USERNAME.options(joinedload(User.bookings))
+_MESSAGES = select(ChatMessage.role, ChatMessage.content).where(ChatMessage.session_id == bindparam("session_id"))
+MESSAGES_BY_SESSION = _MESSAGES.order_by(ChatMessage.created_at, ChatMessage.id)
+# Newest first; callers reverse the rows back into chronological order
+RECENT_MESSAGES_BY_SESSION = _MESSAGES.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(bindparam("limit"))
+DELETE_MESSAGES_BY_SESSION = (
+    delete(ChatMessage).where(ChatMessage.session_id == bindparam("session_id"))
+    .execution_options(synchronize_session=False)
+)
+# Full booking rows as plain tuples (no ORM objects), keyed the way StorageManager returns them
+BOOKING_DETAILS_BY_USERNAME = (
+    select(Booking.booking_reference, Booking.visit_date, Booking.visit_time, Booking.party_size, Booking.status,
+           Booking.special_requests, Booking.customer_info_json.label("customer_info"), Booking.created_at)
+    .join(User, Booking.user_id == User.id)
+    .where(User.username == bindparam("username"))
+)
+# Booking insert that resolves user_id from the username inside the same statement
+# (Core table insert - session.execute would treat parameters to an ORM insert as bulk rows)
+BOOKING_INSERT_FOR_USERNAME = insert(Booking.__table__).from_select(
+    [Booking.user_id, Booking.booking_reference, Booking.visit_date, Booking.visit_time,
+     Booking.party_size, Booking.status, Booking.special_requests, Booking.customer_info_json],
+    select(
+        User.id,
+        bindparam("booking_reference", type_=Booking.booking_reference.type),
+        bindparam("visit_date", type_=Booking.visit_date.type),
+        bindparam("visit_time", type_=Booking.visit_time.type),
+        bindparam("party_size", type_=Booking.party_size.type),
+        bindparam("status", type_=Booking.status.type),
+        bindparam("special_requests", type_=Booking.special_requests.type),
+        bindparam("customer_info", type_=Booking.customer_info_json.type),
+    ).where(User.username == bindparam("username"))
+)
+# Listing columns only - skips the customer_info_json blob and special_requests text
+BOOKING_SUMMARIES_BY_USERNAME = (
+    select(Booking.booking_reference, Booking.visit_date, Booking.visit_time, Booking.party_size, Booking.status)
+    .join(User, Booking.user_id == User.id)
+    .where(User.username == bindparam("username"))
+)
+
+# Detached User rows by ("u", username) / ("i", user_id) - only rows loaded in a private session are cached,
+# and entries are dropped whenever the user is updated or deleted
+_user_cache = TTLCache(maxsize=1024, ttl=60)
+_user_cache_lock = threading.Lock()
+
+# Timestamps set in the INSERT itself so RETURNING reports them - on tables created before the
+# server defaults they would otherwise be filled in afterwards by the AFTER INSERT trigger
+_INSERT_TIMESTAMPS = {"created_at": func.current_timestamp(), "updated_at": func.current_timestamp()}
+
+# Columns update_booking may set (generated/primary key columns excluded)
+_BOOKING_UPDATABLE = frozenset(c.name for c in Booking.__table__.columns) - {'id'}
 
 
 class DatabaseCRUD:
-    """Database CRUD operations class"""
+    """Database CRUD operations class - every method accepts an optional `db` session to share with the caller"""
+    
+    @contextmanager
+    def session(self, db: Optional[Session] = None) -> Iterator[Session]:
+        """Use the caller's session if given, otherwise open (and close) a new one"""
+        if db is not None:
+            yield db
+        else:
+            with db_manager.get_session() as session:
+                yield session
+    
+    @contextmanager
+    def read_session(self, db: Optional[Session] = None) -> Iterator[Session]:
+        """Use the caller's session if given, otherwise a session from the read-only pool"""
+        if db is not None:
+            yield db
+        else:
+            with db_manager.get_read_session() as session:
+                yield session
+    
+    # User cache
+    @staticmethod
+    def _cached_user(key) -> Optional[User]:
+        with _user_cache_lock:
+            return _user_cache.get(key)
+    
+    @staticmethod
+    def _cache_user(user: User):
+        with _user_cache_lock:
+            _user_cache[("u", user.username)] = user
+            _user_cache[("i", user.id)] = user
+    
+    @staticmethod
+    def _forget_user(username: str, user_id: int):
+        with _user_cache_lock:
+            _user_cache.pop(("u", username), None)
+            _user_cache.pop(("i", user_id), None)
     
     # User operations
-    def create_user(self, username: str, password: str, profile: Dict[str, Any] = None) -> User:
+    def create_user(self, username: str, password: str, profile: Dict[str, Any] = None, db: Optional[Session] = None) -> User:
         """Create user"""
-        with db_manager.get_session() as db:
+        with self.session(db) as db:
             # Check if user already exists
-            existing_user = db.query(User).filter(User.username == username).first()
+            existing_user = db.scalars(USER_BY_USERNAME, {"username": username}).first()
             if existing_user:
                 raise ValueError(f"User {username} already exists")
             
             # Hash password
             hashed_password = pwd_context.hash(password)
             
-            user = User(
-                username=username,
-                hashed_password=hashed_password,
-                profile_json=json.dumps(profile or {}, ensure_ascii=False)
-            )
-            db.add(user)
+            # INSERT ... RETURNING loads the new row without a refresh SELECT
+            user = db.scalars(
+                insert(User).values(username=username, hashed_password=hashed_password, profile_json=profile or {},
+                                    **_INSERT_TIMESTAMPS)
+                .returning(User)
+            ).one()
             db.commit()
-            db.refresh(user)
             return user
     
-    def verify_user(self, username: str, password: str) -> Optional[User]:
+    def verify_user(self, username: str, password: str, db: Optional[Session] = None) -> Optional[User]:
         """Verify username and password"""
-        with db_manager.get_session() as db:
-            user = db.query(User).filter(User.username == username).first()
+        with self.read_session(db) as db:
+            user = db.scalars(USER_BY_USERNAME, {"username": username}).first()
             if not user:
                 return None
             
@@ -48,103 +149,200 @@ class DatabaseCRUD:
                 
             return user
     
-    def get_user_by_username(self, username: str) -> Optional[User]:
-        """Get user by username"""
-        with db_manager.get_session() as db:
-            return db.query(User).filter(User.username == username).first()
+    def get_password_hash(self, username: str, db: Optional[Session] = None) -> Optional[str]:
+        """Get the user's current password hash (never cached - callers compare it against what they verified)"""
+        with self.read_session(db) as db:
+            return db.scalars(PASSWORD_HASH_BY_USERNAME, {"username": username}).first()
     
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
-        """Get user by ID"""
-        with db_manager.get_session() as db:
-            return db.query(User).filter(User.id == user_id).first()
+    def get_user_by_username(self, username: str, db: Optional[Session] = None) -> Optional[User]:
+        """Get user by username (cached for a short time)"""
+        user = self._cached_user(("u", username))
+        if user is not None:
+            return user
+        
+        with self.read_session(db) as session:
+            user = session.scalars(USER_BY_USERNAME, {"username": username}).first()
+        # Rows from the caller's session stay attached to it, so they are not cached
+        if user is not None and db is None:
+            self._cache_user(user)
+        return user
+    
+    def get_user_by_email(self, email: str, db: Optional[Session] = None) -> Optional[User]:
+        """Get user by profile email (case-insensitive)"""
+        with self.read_session(db) as db:
+            return db.scalars(USER_BY_EMAIL, {"email": email.lower()}).first()
     
-    def update_user_profile(self, username: str, profile: Dict[str, Any]):
+    def get_user_by_id(self, user_id: int, db: Optional[Session] = None) -> Optional[User]:
+        """Get user by ID (cached for a short time)"""
+        user = self._cached_user(("i", user_id))
+        if user is not None:
+            return user
+        
+        with self.read_session(db) as session:
+            user = session.scalars(USER_BY_ID, {"user_id": user_id}).first()
+        if user is not None and db is None:
+            self._cache_user(user)
+        return user
+    
+    def update_user_profile(self, username: str, profile: Dict[str, Any], db: Optional[Session] = None):
         """Update user profile"""
-        with db_manager.get_session() as db:
-            user = db.query(User).filter(User.username == username).first()
+        with self.session(db) as db:
+            user = db.scalars(USER_BY_USERNAME, {"username": username}).first()
             if not user:
                 raise ValueError(f"User {username} does not exist")
             
-            user.profile_json = json.dumps(profile, ensure_ascii=False)
+            user_id = user.id
+            user.profile_json = profile
             db.commit()
+            self._forget_user(username, user_id)
     
-    def update_user_password(self, username: str, new_password: str):
+    def update_user_password(self, username: str, new_password: str, db: Optional[Session] = None):
         """Update user password"""
-        with db_manager.get_session() as db:
-            user = db.query(User).filter(User.username == username).first()
+        with self.session(db) as db:
+            user = db.scalars(USER_BY_USERNAME, {"username": username}).first()
             if not user:
                 raise ValueError(f"User {username} does not exist")
             
+            user_id = user.id
             user.hashed_password = pwd_context.hash(new_password)
             db.commit()
+            self._forget_user(username, user_id)
     
-    def list_users(self) -> List[str]:
+    def list_users(self, db: Optional[Session] = None) -> List[str]:
         """List all usernames"""
-        with db_manager.get_session() as db:
-            users = db.query(User.username).all()
-            return [user.username for user in users]
+        with self.read_session(db) as db:
+            # Column projection - never loads profile_json or builds ORM objects
+            return list(db.scalars(select(User.username)))
     
-    def delete_user(self, username: str) -> bool:
+    def delete_user(self, username: str, db: Optional[Session] = None) -> bool:
         """Delete user account"""
-        with db_manager.get_session() as db:
-            user = db.query(User).filter(User.username == username).first()
+        with self.session(db) as db:
+            user = db.scalars(USER_BY_USERNAME, {"username": username}).first()
             if not user:
                 return False
             
+            user_id = user.id
             db.delete(user)
             db.commit()
+            self._forget_user(username, user_id)
             return True
 
     # Booking operations
     def create_booking(self, user_id: int, booking_reference: str, 
                       visit_date: str, visit_time: str, party_size: int,
                       status: str = "confirmed", special_requests: str = None,
-                      customer_info: Dict[str, Any] = None) -> Booking:
+                      customer_info: Dict[str, Any] = None, db: Optional[Session] = None) -> Booking:
         """Create new booking"""
-        with db_manager.get_session() as db:
-            booking = Booking(
-                user_id=user_id,
-                booking_reference=booking_reference,
-                visit_date=visit_date,
-                visit_time=visit_time,
-                party_size=party_size,
-                status=status,
-                special_requests=special_requests,
-                customer_info_json=json.dumps(customer_info or {}, ensure_ascii=False)
-            )
-            db.add(booking)
+        with self.session(db) as db:
+            booking = db.scalars(
+                insert(Booking).values(
+                    user_id=user_id,
+                    booking_reference=booking_reference,
+                    visit_date=visit_date,
+                    visit_time=visit_time,
+                    party_size=party_size,
+                    status=status,
+                    special_requests=special_requests,
+                    customer_info_json=customer_info or {},
+                    **_INSERT_TIMESTAMPS
+                ).returning(Booking)
+            ).one()
             db.commit()
-            db.refresh(booking)
             return booking
     
-    def get_booking_by_reference(self, booking_reference: str) -> Optional[Booking]:
+    def create_booking_for_username(self, username: str, booking_reference: str,
+                                    visit_date: str, visit_time: str, party_size: int,
+                                    status: str = "confirmed", special_requests: str = None,
+                                    customer_info: Dict[str, Any] = None, db: Optional[Session] = None) -> bool:
+        """Create booking for a username with one INSERT ... SELECT; False if the user does not exist"""
+        with self.session(db) as db:
+            result = db.execute(BOOKING_INSERT_FOR_USERNAME, {
+                "username": username,
+                "booking_reference": booking_reference,
+                "visit_date": visit_date,
+                "visit_time": visit_time,
+                "party_size": party_size,
+                "status": status,
+                "special_requests": special_requests,
+                "customer_info": customer_info or {}
+            })
+            db.commit()
+            return result.rowcount > 0
+    
+    def create_bookings_bulk(self, user_id: int, bookings: List[Dict[str, Any]], db: Optional[Session] = None) -> int:
+        """Create many bookings for one user with a single executemany INSERT"""
+        rows = [
+            {
+                "user_id": user_id,
+                "booking_reference": b["booking_reference"],
+                "visit_date": b["visit_date"],
+                "visit_time": b["visit_time"],
+                "party_size": b["party_size"],
+                "status": b.get("status", "confirmed"),
+                "special_requests": b.get("special_requests"),
+                "customer_info_json": b.get("customer_info") or {}
+            }
+            for b in bookings
+        ]
+        if not rows:
+            return 0
+        
+        with self.session(db) as db:
+            db.execute(insert(Booking), rows)
+            db.commit()
+        return len(rows)
+    
+    def get_booking_by_reference(self, booking_reference: str, db: Optional[Session] = None) -> Optional[Booking]:
         """Get booking by reference number"""
-        with db_manager.get_session() as db:
-            return db.query(Booking).filter(Booking.booking_reference == booking_reference).first()
+        with self.read_session(db) as db:
+            return db.scalars(BOOKING_BY_REF, {"ref": booking_reference}).first()
     
-    def get_user_bookings(self, user_id: int) -> List[Booking]:
+    def get_user_bookings(self, user_id: int, db: Optional[Session] = None) -> List[Booking]:
         """Get all bookings for user"""
-        with db_manager.get_session() as db:
-            return db.query(Booking).filter(Booking.user_id == user_id).all()
+        with self.read_session(db) as db:
+            return db.scalars(BOOKINGS_BY_USER, {"user_id": user_id}).all()
     
-    def update_booking(self, booking_reference: str, **kwargs) -> bool:
+    def get_user_with_bookings(self, username: str, db: Optional[Session] = None) -> Optional[User]:
+        """Get user with bookings loaded in the same query"""
+        with self.read_session(db) as db:
+            return db.scalars(USER_WITH_BOOKINGS, {"username": username}).unique().first()
+    
+    def get_user_booking_details(self, username: str, db: Optional[Session] = None) -> List[Dict[str, Any]]:
+        """Get all columns of a user's bookings as dicts in one Core query"""
+        with self.read_session(db) as db:
+            rows = db.execute(BOOKING_DETAILS_BY_USERNAME, {"username": username}).all()
+        return [
+            {"booking_reference": ref, "visit_date": visit_date, "visit_time": visit_time, "party_size": party_size,
+             "status": status, "special_requests": special_requests, "customer_info": customer_info or {},
+             "created_at": created_at}
+            for ref, visit_date, visit_time, party_size, status, special_requests, customer_info, created_at in rows
+        ]
+    
+    def get_user_booking_summaries(self, username: str, db: Optional[Session] = None) -> List[Dict[str, Any]]:
+        """Get the listing columns of a user's bookings in one query, without the heavy columns"""
+        with self.read_session(db) as db:
+            return [dict(row) for row in db.execute(BOOKING_SUMMARIES_BY_USERNAME, {"username": username}).mappings()]
+    
+    def update_booking(self, booking_reference: str, db: Optional[Session] = None, **kwargs) -> bool:
         """Update booking"""
-        with db_manager.get_session() as db:
-            booking = db.query(Booking).filter(Booking.booking_reference == booking_reference).first()
-            if not booking:
-                return False
-            
-            for key, value in kwargs.items():
-                if hasattr(booking, key) and key != 'id':
-                    setattr(booking, key, value)
+        values = {key: value for key, value in kwargs.items() if key in _BOOKING_UPDATABLE}
+        
+        with self.session(db) as db:
+            if not values:
+                return db.scalars(BOOKING_BY_REF, {"ref": booking_reference}).first() is not None
             
+            # Single UPDATE statement, no row fetch
+            result = db.execute(
+                update(Booking).where(Booking.booking_reference == booking_reference).values(values),
+                execution_options={"synchronize_session": False}
+            )
             db.commit()
-            return True
+            return result.rowcount > 0
     
-    def delete_booking(self, booking_reference: str) -> bool:
+    def delete_booking(self, booking_reference: str, db: Optional[Session] = None) -> bool:
         """Delete booking"""
-        with db_manager.get_session() as db:
-            booking = db.query(Booking).filter(Booking.booking_reference == booking_reference).first()
+        with self.session(db) as db:
+            booking = db.scalars(BOOKING_BY_REF, {"ref": booking_reference}).first()
             if not booking:
                 return False
             
@@ -153,42 +351,74 @@ class DatabaseCRUD:
             return True
     
     # Chat session operations
-    def save_chat_session(self, user_id: int, session_data: Dict[str, Any]):
-        """Save chat session"""
-        with db_manager.get_session() as db:
-            # Check if session exists
-            session = db.query(ChatSession).filter(ChatSession.user_id == user_id).first()
+    def _upsert_chat_session(self, db: Session, user_id: int, session_data: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Insert or touch the user's chat session row in one statement and return its id.
+        session_data, when given, replaces the stored metadata.
+        """
+        stmt = sqlite_insert(ChatSession).values(user_id=user_id, session_data_json=session_data or {})
+        set_ = {"updated_at": func.current_timestamp()}
+        if session_data is not None:
+            set_["session_data_json"] = stmt.excluded.session_data_json
+        stmt = stmt.on_conflict_do_update(index_elements=["user_id"], set_=set_).returning(ChatSession.id)
+        return db.execute(stmt).scalar_one()
+    
+    def save_chat_session(self, user_id: int, session_data: Dict[str, Any], db: Optional[Session] = None):
+        """Save chat session (a chat_history list replaces the stored messages)"""
+        session_data = dict(session_data)
+        chat_history = session_data.pop("chat_history", None)
+        
+        with self.session(db) as db:
+            session_id = self._upsert_chat_session(db, user_id, session_data)
             
-            if session:
-                # Update existing session
-                session.session_data_json = json.dumps(session_data, ensure_ascii=False)
-                session.updated_at = db_manager.get_current_timestamp()
-            else:
-                # Create new session
-                session = ChatSession(
-                    user_id=user_id,
-                    session_data_json=json.dumps(session_data, ensure_ascii=False)
-                )
-                db.add(session)
+            if chat_history is not None:
+                db.execute(DELETE_MESSAGES_BY_SESSION, {"session_id": session_id})
+                if chat_history:
+                    db.execute(insert(ChatMessage), [
+                        {"session_id": session_id, "role": msg["type"], "content": msg["content"]}
+                        for msg in chat_history
+                    ])
             
             db.commit()
     
-    def get_chat_session(self, user_id: int) -> Dict[str, Any]:
-        """Get chat session"""
-        with db_manager.get_session() as db:
-            session = db.query(ChatSession).filter(ChatSession.user_id == user_id).first()
-            if session:
-                return json.loads(session.session_data_json)
-            return {}
+    def append_chat_messages(self, user_id: int, messages: List[Dict[str, str]], db: Optional[Session] = None):
+        """Append messages ({"type", "content"}) to the chat session without rewriting it"""
+        if not messages:
+            return
+        
+        with self.session(db) as db:
+            session_id = self._upsert_chat_session(db, user_id)
+            db.execute(insert(ChatMessage), [
+                {"session_id": session_id, "role": msg["type"], "content": msg["content"]}
+                for msg in messages
+            ])
+            db.commit()
     
-    def clear_chat_session(self, user_id: int):
+    def get_chat_session(self, user_id: int, history_limit: Optional[int] = None, db: Optional[Session] = None) -> Dict[str, Any]:
+        """Get chat session, optionally limited to the most recent `history_limit` messages"""
+        with self.read_session(db) as db:
+            session = db.scalars(CHAT_SESSION_BY_USER, {"user_id": user_id}).first()
+            if not session:
+                return {}
+            
+            if history_limit is not None:
+                rows = db.execute(RECENT_MESSAGES_BY_SESSION, {"session_id": session.id, "limit": history_limit}).all()
+                rows.reverse()
+            else:
+                rows = db.execute(MESSAGES_BY_SESSION, {"session_id": session.id}).all()
+            
+            session_data = dict(session.session_data_json or {})
+            session_data["chat_history"] = [{"type": role, "content": content} for role, content in rows]
+            return session_data
+    
+    def clear_chat_session(self, user_id: int, db: Optional[Session] = None):
         """Clear chat session"""
-        with db_manager.get_session() as db:
-            session = db.query(ChatSession).filter(ChatSession.user_id == user_id).first()
+        with self.session(db) as db:
+            session = db.scalars(CHAT_SESSION_BY_USER, {"user_id": user_id}).first()
             if session:
+                db.execute(DELETE_MESSAGES_BY_SESSION, {"session_id": session.id})
                 db.delete(session)
                 db.commit()
 
-
 # Global CRUD instance
 crud = DatabaseCRUD() 
\ No newline at end of file
@@ -1,15 +1,55 @@
 """
 Database Model Definitions - SQLite + SQLAlchemy
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, LargeBinary, ForeignKey, Computed, FetchedValue, Index, create_engine, event, func, insert, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.types import TypeDecorator
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Dict, List
 import os
+import orjson
+import zstandard
 
 Base = declarative_base()
 
 
+class CompressedJSON(TypeDecorator):
+    """
+    JSON stored as a BLOB with a 1-byte format prefix: 0 = raw UTF-8 JSON, 1 = zstd-compressed JSON.
+    Payloads under COMPRESS_THRESHOLD bytes are left uncompressed; legacy TEXT rows are still readable.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    RAW = b"\x00"
+    ZSTD = b"\x01"
+    COMPRESS_THRESHOLD = 1024
+    COMPRESS_LEVEL = 3
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        payload = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        if len(payload) < self.COMPRESS_THRESHOLD:
+            return self.RAW + payload
+        return self.ZSTD + zstandard.compress(payload, self.COMPRESS_LEVEL)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # Row written before the column was compressed
+            return orjson.loads(value)
+        prefix, payload = value[:1], value[1:]
+        if prefix == self.ZSTD:
+            payload = zstandard.decompress(payload)
+        return orjson.loads(payload)
+
+
 class User(Base):
     """User table"""
     __tablename__ = 'users'
@@ -17,13 +57,15 @@ class User(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(100), unique=True, nullable=False, index=True)
     hashed_password = Column(String(255), nullable=False)  # Password field
-    profile_json = Column(Text, nullable=False, default='{}')
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    profile_json = Column(JSON, nullable=False, default=dict)
+    # Indexed projection of profile Email for lookups without decoding every profile
+    email_idx = Column(Text, Computed("lower(json_extract(profile_json, '$.Email'))", persisted=False), index=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
-    bookings = relationship("Booking", back_populates="user", cascade="all, delete-orphan")
-    sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan")
+    bookings = relationship("Booking", back_populates="user", cascade="all, delete-orphan", lazy="raise_on_sql")
+    sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan", lazy="raise_on_sql")
 
 
 class Booking(Base):
@@ -39,12 +81,17 @@ class Booking(Base):
     party_size = Column(Integer, nullable=False)
     status = Column(String(20), nullable=False, default='confirmed')  # confirmed, cancelled, updated
     special_requests = Column(Text)
-    customer_info_json = Column(Text)  # Store customer information JSON
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    customer_info_json = Column(CompressedJSON)  # Store customer information JSON
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
     user = relationship("User", back_populates="bookings")
+    
+    __table_args__ = (
+        Index('ix_bookings_user_date', 'user_id', 'visit_date'),
+        Index('ix_bookings_status', 'status'),
+    )
 
 
 class ChatSession(Base):
@@ -53,17 +100,44 @@ class ChatSession(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    session_data_json = Column(Text, nullable=False, default='{}')  # Fixed field name to match CRUD operations
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    session_data_json = Column(CompressedJSON, nullable=False, default=dict)  # Fixed field name to match CRUD operations
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
     user = relationship("User", back_populates="sessions")
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", lazy="raise_on_sql")
+    
+    __table_args__ = (
+        # One session per user - lets saves upsert with ON CONFLICT(user_id)
+        Index('ux_chat_sessions_user', 'user_id', unique=True),
+    )
+
+
+class ChatMessage(Base):
+    """Chat message table - one row per message, appended as the conversation grows"""
+    __tablename__ = 'chat_messages'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey('chat_sessions.id'), nullable=False)
+    role = Column(String(20), nullable=False)  # human, ai
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    # Relationships
+    session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        Index('ix_msg_session_created', 'session_id', 'created_at'),
+    )
 
 
 class DatabaseManager:
     """Database manager"""
     
+    # Bump whenever the steps in migrate() change; stored in SQLite's PRAGMA user_version
+    SCHEMA_VERSION = 2
+    
     def __init__(self, db_path: str = "data/restaurant_booking.db"):
         self.db_path = db_path
         
@@ -71,23 +145,190 @@ class DatabaseManager:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         # Create engine and session
-        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
-        self.SessionLocal = sessionmaker(bind=self.engine)
+        self.engine = create_engine(
+            f'sqlite:///{db_path}',
+            echo=False,
+            connect_args={"check_same_thread": False, "timeout": 30},
+            poolclass=QueuePool,
+            pool_size=5,
+            max_overflow=10,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            insertmanyvalues_page_size=1000,
+            query_cache_size=1200,
+            json_serializer=lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8"),
+            json_deserializer=orjson.loads
+        )
+        event.listen(self.engine, "connect", self._apply_sqlite_pragmas)
+        # Objects stay usable after commit without a reload SELECT; sessions are short-lived, one per logical operation
+        self.SessionLocal = sessionmaker(bind=self.engine, expire_on_commit=False)
+        
+        # Separate query_only pool for lookups and listings, so reads never wait on a writer's pool slot
+        # (WAL already lets them run alongside the write transaction)
+        self.read_engine = create_engine(
+            f'sqlite:///{db_path}',
+            echo=False,
+            connect_args={"check_same_thread": False, "timeout": 30},
+            poolclass=QueuePool,
+            pool_size=8,
+            max_overflow=8,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            query_cache_size=1200,
+            json_serializer=lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8"),
+            json_deserializer=orjson.loads
+        )
+        event.listen(self.read_engine, "connect", self._apply_sqlite_pragmas)
+        event.listen(self.read_engine, "connect", self._apply_query_only)
+        self.ReadSessionLocal = sessionmaker(bind=self.read_engine, expire_on_commit=False)
         
-        # Create tables
+        # Only run schema DDL/introspection when the database is behind (or RUN_MIGRATIONS=1)
+        if os.getenv("RUN_MIGRATIONS") == "1" or self._schema_version() < self.SCHEMA_VERSION:
+            self.migrate()
+    
+    def _schema_version(self) -> int:
+        """Schema version recorded in the database file"""
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql("PRAGMA user_version").scalar()
+    
+    def migrate(self):
+        """Create tables, apply schema upgrades and record SCHEMA_VERSION"""
         Base.metadata.create_all(self.engine)
+        self._ensure_computed_columns()
+        self._migrate_chat_history()
+        self._dedupe_chat_sessions()
+        self._ensure_indexes()
+        self._ensure_timestamp_triggers()
+        
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+    
+    def _ensure_computed_columns(self):
+        """Add generated columns introduced after a table was first created"""
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {row[1] for row in conn.execute(text(f"PRAGMA table_xinfo({table.name})"))}
+                for column in table.columns:
+                    if column.computed is not None and column.name not in existing:
+                        column_ddl = CreateColumn(column).compile(dialect=self.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+    
+    def _ensure_indexes(self):
+        """Create indexes added after a table was first created (create_all skips existing tables)"""
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
     
+    def _ensure_timestamp_triggers(self):
+        """
+        Maintain created_at/updated_at inside SQLite.
+        SQLite has no ON UPDATE clause, and tables created before the switch to
+        server defaults have no DEFAULT on created_at/updated_at, so triggers fill both.
+        """
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if 'created_at' not in table.c or 'updated_at' not in table.c:
+                    continue
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_{table.name}_created AFTER INSERT ON {table.name} "
+                    f"WHEN NEW.created_at IS NULL BEGIN "
+                    f"UPDATE {table.name} SET created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id; END"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_{table.name}_updated AFTER UPDATE ON {table.name} BEGIN "
+                    f"UPDATE {table.name} SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id; END"
+                ))
+    
+    def _migrate_chat_history(self):
+        """Move chat_history lists embedded in chat_sessions.session_data_json into chat_messages rows"""
+        sessions = ChatSession.__table__
+        with self.engine.begin() as conn:
+            # Only legacy TEXT rows can still embed a chat_history list
+            rows = conn.execute(
+                sessions.select().where(func.typeof(sessions.c.session_data_json) == 'text')
+            ).all()
+            for row in rows:
+                session_data = dict(row.session_data_json or {})
+                if "chat_history" not in session_data:
+                    continue
+                messages = [
+                    {"session_id": row.id, "role": msg["type"], "content": msg["content"]}
+                    for msg in session_data.pop("chat_history", []) or []
+                ]
+                if messages:
+                    conn.execute(insert(ChatMessage), messages)
+                conn.execute(
+                    sessions.update().where(sessions.c.id == row.id).values(session_data_json=session_data)
+                )
+    
+    def _dedupe_chat_sessions(self):
+        """Keep the oldest chat session per user (moving messages onto it) so the unique user_id index can be built"""
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE chat_messages SET session_id = ("
+                "SELECT MIN(keep.id) FROM chat_sessions keep JOIN chat_sessions cur ON keep.user_id = cur.user_id "
+                "WHERE cur.id = chat_messages.session_id) "
+                "WHERE session_id IN (SELECT id FROM chat_sessions) "
+                "AND session_id NOT IN (SELECT MIN(id) FROM chat_sessions GROUP BY user_id)"
+            ))
+            conn.execute(text(
+                "DELETE FROM chat_sessions WHERE id NOT IN (SELECT MIN(id) FROM chat_sessions GROUP BY user_id)"
+            ))
+    
+    @staticmethod
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        """Tune every new SQLite connection: WAL journal, relaxed fsync, in-memory temp storage"""
+        cursor = dbapi_connection.cursor()
+        cursor.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA cache_size=-64000;"
+            "PRAGMA mmap_size=268435456;"
+        )
+        cursor.close()
+    
+    @staticmethod
+    def _apply_query_only(dbapi_connection, connection_record):
+        """Reject writes on read pool connections"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=1")
+        cursor.close()
+    
+    @contextmanager
     def get_session(self):
-        """Get database session"""
-        return self.SessionLocal()
+        """Get database session (closed on exit, connection returned to the pool)"""
+        session = self.SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    @contextmanager
+    def get_read_session(self):
+        """Get a read-only session from the query_only pool (closed on exit)"""
+        session = self.ReadSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    def bulk_insert(self, model, rows: List[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """Insert many rows with one executemany per batch instead of one ORM flush per row"""
+        with self.get_session() as db:
+            for start in range(0, len(rows), batch_size):
+                db.execute(insert(model), rows[start:start + batch_size])
+                db.commit()
+        return len(rows)
     
     def get_current_timestamp(self):
         """Get current timestamp for updates"""
         return datetime.utcnow()
     
     def close(self):
-        """Close database connection"""
+        """Close database connections"""
         self.engine.dispose()
+        self.read_engine.dispose()
 
 
 # Global database manager instance
@@ -0,0 +1,43 @@
+"""
+Response Cache - Short-lived caching for read-heavy API endpoints
+Shares the session store backend (Redis when configured, in-process otherwise)
+"""
+import functools
+import orjson
+from fastapi.encoders import jsonable_encoder
+from .session_store import session_store
+
+CACHE_PREFIX = "cache:"
+
+
+def cached_response(key_template: str, ttl: int):
+    """
+    Cache the JSON-compatible result of an async endpoint for `ttl` seconds.
+    `key_template` is formatted with the endpoint's keyword arguments, e.g. "user:{username}".
+    Exceptions (such as HTTPException) are never cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = f"{CACHE_PREFIX}{key_template.format(**kwargs)}"
+            cached = await session_store.backend.get(key)
+            if cached is not None:
+                return orjson.loads(cached)
+
+            result = jsonable_encoder(await func(*args, **kwargs))
+            await session_store.backend.set(key, orjson.dumps(result).decode("utf-8"), ttl)
+            return result
+        return wrapper
+    return decorator
+
+
+async def invalidate_cache(*keys: str):
+    """Drop cached responses, e.g. invalidate_cache(f"user:{username}", "users:list")"""
+    for key in keys:
+        await session_store.backend.delete(f"{CACHE_PREFIX}{key}")
+
+
+def invalidate_cache_sync(*keys: str):
+    """Synchronous invalidate_cache for writes made outside the event loop (storage layer, agent tools)"""
+    for key in keys:
+        session_store.backend.delete_sync(f"{CACHE_PREFIX}{key}")
@@ -2,9 +2,9 @@
 Unified Storage Management Interface
 Provides a consistent interface for data access operations
 """
-import json
 from typing import Dict, List, Any, Optional
 from ..database.crud import crud
+from .cache import invalidate_cache_sync
 
 
 class StorageManager:
@@ -28,28 +28,46 @@ class StorageManager:
         user = self.crud.verify_user(username, password)
         return user is not None
 
+    def verify_user_hash(self, username: str, password: str) -> Optional[str]:
+        """Verify user credentials, returning the password hash they matched (None if they did not)"""
+        user = self.crud.verify_user(username, password)
+        return user.hashed_password if user else None
+
+    def get_password_hash(self, username: str) -> Optional[str]:
+        """Get the user's current password hash (None if the user does not exist)"""
+        return self.crud.get_password_hash(username)
+
     def get_user(self, username: str) -> Optional[Dict[str, Any]]:
         """Get user information"""
         user = self.crud.get_user_by_username(username)
         if not user:
             return None
 
-        # Parse profile JSON
-        try:
-            profile = json.loads(user.profile_json) if user.profile_json else {}
-        except (json.JSONDecodeError, TypeError):
-            profile = {}
+        return {
+            "id": user.id,
+            "username": user.username,
+            "profile": dict(user.profile_json or {}),
+            "created_at": user.created_at
+        }
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get user information by profile email (uses the indexed email column)"""
+        user = self.crud.get_user_by_email(email)
+        if not user:
+            return None
 
         return {
             "id": user.id,
             "username": user.username,
-            "profile": profile,
+            "profile": dict(user.profile_json or {}),
             "created_at": user.created_at
         }
 
     def update_user_profile(self, username: str, profile: Dict[str, Any]):
         """Update user profile"""
         self.crud.update_user_profile(username, profile)
+        # Every profile write (REST, chat agent, tools) drops the cached /user/{username} response
+        invalidate_cache_sync(f"user:{username}")
 
     def update_user_password(self, username: str, new_password: str):
         """Update user password"""
@@ -66,12 +84,9 @@ class StorageManager:
     # Booking management
     def create_booking(self, username: str, booking_data: Dict[str, Any]) -> str:
         """Create new booking"""
-        user = self.crud.get_user_by_username(username)
-        if not user:
-            raise ValueError(f"User {username} not found")
-
-        booking = self.crud.create_booking(
-            user_id=user.id,
+        # User lookup and insert in one statement
+        created = self.crud.create_booking_for_username(
+            username=username,
             booking_reference=booking_data["booking_reference"],
             visit_date=booking_data["visit_date"],
             visit_time=booking_data["visit_time"],
@@ -80,7 +95,19 @@ class StorageManager:
             special_requests=booking_data.get("special_requests"),
             customer_info=booking_data.get("customer_info", {})
         )
-        return booking.booking_reference
+        if not created:
+            raise ValueError(f"User {username} not found")
+        return booking_data["booking_reference"]
+
+    def create_bookings_bulk(self, username: str, bookings: List[Dict[str, Any]]) -> List[str]:
+        """Create many bookings for user in one batched insert"""
+        with self.crud.session() as db:
+            user = self.crud.get_user_by_username(username, db=db)
+            if not user:
+                raise ValueError(f"User {username} not found")
+
+            self.crud.create_bookings_bulk(user.id, bookings, db=db)
+            return [b["booking_reference"] for b in bookings]
 
     def get_booking(self, booking_reference: str) -> Optional[Dict[str, Any]]:
         """Get booking by reference"""
@@ -88,11 +115,6 @@ class StorageManager:
         if not booking:
             return None
 
-        try:
-            customer_info = json.loads(booking.customer_info_json) if booking.customer_info_json else {}
-        except (json.JSONDecodeError, TypeError):
-            customer_info = {}
-
         return {
             "booking_reference": booking.booking_reference,
             "visit_date": booking.visit_date,
@@ -100,43 +122,24 @@ class StorageManager:
             "party_size": booking.party_size,
             "status": booking.status,
             "special_requests": booking.special_requests,
-            "customer_info": customer_info,
+            "customer_info": booking.customer_info_json or {},
             "created_at": booking.created_at
         }
 
     def get_user_bookings(self, username: str) -> List[Dict[str, Any]]:
         """Get all bookings for user"""
-        user = self.crud.get_user_by_username(username)
-        if not user:
-            return []
-
-        bookings = self.crud.get_user_bookings(user.id)
-        result = []
-
-        for booking in bookings:
-            try:
-                customer_info = json.loads(booking.customer_info_json) if booking.customer_info_json else {}
-            except (json.JSONDecodeError, TypeError):
-                customer_info = {}
-
-            result.append({
-                "booking_reference": booking.booking_reference,
-                "visit_date": booking.visit_date,
-                "visit_time": booking.visit_time,
-                "party_size": booking.party_size,
-                "status": booking.status,
-                "special_requests": booking.special_requests,
-                "customer_info": customer_info,
-                "created_at": booking.created_at
-            })
-
-        return result
+        # Plain rows in one query - no ORM objects to build
+        return self.crud.get_user_booking_details(username)
+
+    def list_user_bookings_summary(self, username: str) -> List[Dict[str, Any]]:
+        """List user's bookings with listing fields only (no customer info or special requests)"""
+        return self.crud.get_user_booking_summaries(username)
 
     def update_booking(self, booking_reference: str, updates: Dict[str, Any]) -> bool:
         """Update booking"""
-        # Convert customer_info dict to JSON string if present
+        # customer_info is stored in the JSON column customer_info_json
         if "customer_info" in updates:
-            updates["customer_info_json"] = json.dumps(updates.pop("customer_info"))
+            updates["customer_info_json"] = updates.pop("customer_info")
 
         return self.crud.update_booking(booking_reference, **updates)
 
@@ -147,34 +150,37 @@ class StorageManager:
     # Session management
     def save_session(self, username: str, session_data: Dict[str, Any]):
         """Save user session data"""
-        user = self.crud.get_user_by_username(username)
-        if not user:
-            raise ValueError(f"User {username} not found")
+        with self.crud.session() as db:
+            user = self.crud.get_user_by_username(username, db=db)
+            if not user:
+                raise ValueError(f"User {username} not found")
+
+            self.crud.save_chat_session(user.id, session_data, db=db)
 
-        self.crud.save_chat_session(user.id, session_data)
+    def append_session_messages(self, username: str, messages: List[Dict[str, str]]):
+        """Append chat messages to user session without rewriting the history"""
+        with self.crud.session() as db:
+            user = self.crud.get_user_by_username(username, db=db)
+            if not user:
+                raise ValueError(f"User {username} not found")
 
-    def get_session(self, username: str) -> Dict[str, Any]:
+            self.crud.append_chat_messages(user.id, messages, db=db)
+
+    def get_session(self, username: str, history_limit: Optional[int] = None) -> Dict[str, Any]:
         """Get user session data"""
-        user = self.crud.get_user_by_username(username)
-        if not user:
-            return {}
+        with self.crud.read_session() as db:
+            user = self.crud.get_user_by_username(username, db=db)
+            if not user:
+                return {}
 
-        return self.crud.get_chat_session(user.id)
+            return self.crud.get_chat_session(user.id, history_limit, db=db)
 
     def clear_session(self, username: str):
         """Clear user session"""
-        user = self.crud.get_user_by_username(username)
-        if user:
-            self.crud.clear_chat_session(user.id)
-
-    # Legacy compatibility methods (deprecated but maintained for backward compatibility)
-    def set_current_user(self, username: str):
-        """Set current user (legacy method - no longer used)"""
-        pass  # This method is kept for backward compatibility but does nothing
-
-    def get_current_user(self) -> Optional[str]:
-        """Get current user (legacy method - no longer used)"""
-        return None  # This method is kept for backward compatibility
+        with self.crud.session() as db:
+            user = self.crud.get_user_by_username(username, db=db)
+            if user:
+                self.crud.clear_chat_session(user.id, db=db)
 
 
 # Global storage manager instance
@@ -0,0 +1,123 @@
+"""
+Session Store - Expiring key/value storage for login sessions and password reset codes
+Uses Redis when REDIS_URL is configured so multiple workers share auth state,
+otherwise falls back to an in-process store with the same TTL semantics
+"""
+import threading
+import time
+import orjson
+from cachetools import TLRUCache
+from typing import Dict, Any, Optional
+from ..config import config
+
+
+class InMemorySessionBackend:
+    """In-process backend - single worker only, entries expire after their TTL"""
+
+    MAX_ENTRIES = 100_000
+
+    def __init__(self):
+        # Values are stored as (ttl, value) and expire ttl seconds after their last write.
+        # TLRUCache keeps expiry times in a heap, so writes only pay for entries that actually expired.
+        self._data = TLRUCache(maxsize=self.MAX_ENTRIES, ttu=lambda key, entry, now: now + entry[0], timer=time.monotonic)
+        # delete_sync runs on worker threads
+        self._lock = threading.Lock()
+
+    async def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._data[key] = (ttl, value)
+
+    async def get(self, key: str, ttl: Optional[int] = None) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            # Sliding expiration
+            if ttl is not None:
+                self._data[key] = (ttl, entry[1])
+            return entry[1]
+
+    async def delete(self, key: str):
+        self.delete_sync(key)
+
+    def delete_sync(self, key: str):
+        """Delete from synchronous code (worker threads, tools)"""
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisSessionBackend:
+    """Redis backend - shared across workers, expiry handled by Redis"""
+
+    def __init__(self, url: str):
+        import redis
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.Redis.from_url(url, decode_responses=True)
+        # Blocking client for deletes issued from synchronous code
+        self._redis_sync = redis.Redis.from_url(url, decode_responses=True)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self._redis.set(key, value, ex=ttl)
+
+    async def get(self, key: str, ttl: Optional[int] = None) -> Optional[str]:
+        if ttl is not None:
+            return await self._redis.getex(key, ex=ttl)
+        return await self._redis.get(key)
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    def delete_sync(self, key: str):
+        """Delete from synchronous code (worker threads, tools)"""
+        self._redis_sync.delete(key)
+
+
+class SessionStore:
+    """Login session and reset code storage with automatic expiration"""
+
+    SESSION_PREFIX = "sess:"
+    RESET_CODE_PREFIX = "reset:"
+
+    def __init__(self, redis_url: str = ""):
+        """Initialize session store"""
+        if redis_url:
+            self.backend = RedisSessionBackend(redis_url)
+        else:
+            self.backend = InMemorySessionBackend()
+
+    # Login sessions
+    async def create_session(self, session_id: str, session_data: Dict[str, Any]):
+        """Store session metadata"""
+        await self.backend.set(
+            f"{self.SESSION_PREFIX}{session_id}",
+            orjson.dumps(session_data).decode("utf-8"),
+            config.SESSION_TTL_SECONDS
+        )
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get session metadata and extend its lifetime"""
+        raw = await self.backend.get(f"{self.SESSION_PREFIX}{session_id}", ttl=config.SESSION_TTL_SECONDS)
+        return orjson.loads(raw) if raw else None
+
+    async def delete_session(self, session_id: str):
+        """Delete session"""
+        await self.backend.delete(f"{self.SESSION_PREFIX}{session_id}")
+
+    # Password reset codes
+    async def set_reset_code(self, username: str, reset_code: str):
+        """Store password reset code"""
+        await self.backend.set(f"{self.RESET_CODE_PREFIX}{username}", reset_code, config.RESET_CODE_TTL_SECONDS)
+
+    async def get_reset_code(self, username: str) -> Optional[str]:
+        """Get password reset code"""
+        return await self.backend.get(f"{self.RESET_CODE_PREFIX}{username}")
+
+    async def delete_reset_code(self, username: str):
+        """Delete password reset code"""
+        await self.backend.delete(f"{self.RESET_CODE_PREFIX}{username}")
+
+
+# Global session store instance
+session_store = SessionStore(config.REDIS_URL)
@@ -1,7 +1,9 @@
 """
 Booking-related tool functions
 """
-import json
+import re
+import orjson
+from functools import lru_cache
 from typing import Optional, Dict, Any, List
 from datetime import datetime, date, time
 from langchain.tools import tool
@@ -13,6 +15,7 @@ from ..api.schemas import (
     AvailabilityRequest, CancelBookingRequest
 )
 from ..database.crud import crud
+from ..storage.manager import storage
 from ..config import config
 
 
@@ -25,6 +28,18 @@ CANCELLATION_REASONS = {
     5: "No Show"
 }
 
+# CustomerInfo field -> snake_case key used in the locally stored customer_info
+_CUSTOMER_INFO_KEYS = {
+    field: re.sub(r"(?<!^)(?=[A-Z])", "_", field).lower()
+    for field in CustomerInfo.model_fields
+}
+
+def _to_json(obj: Any) -> str:
+    """Serialize a tool result to a JSON string (UTF-8, non-ASCII kept as-is)"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+# date/time objects are immutable, so parsed values are shared; invalid strings raise and are not cached
+@lru_cache(maxsize=1024)
 def _parse_date(date_str: str) -> date:
     """解析日期字符串为 date 对象"""
     try:
@@ -32,6 +47,7 @@ def _parse_date(date_str: str) -> date:
     except ValueError:
         raise ValueError(f"无效的日期格式: {date_str}，请使用 YYYY-MM-DD 格式")
 
+@lru_cache(maxsize=1024)
 def _parse_time(time_str: str) -> time:
     """解析时间字符串为 time 对象"""
     try:
@@ -64,36 +80,37 @@ def check_availability_tool(visit_date: str, party_size: int) -> str:
         
         response = api_client.check_availability(request)
         
-        # Convert to user-friendly format
+        # Convert to user-friendly format (one pass over the slots; the count reuses the filtered list)
+        available_slots = [
+            {
+                "time": slot.time,
+                "available": slot.available,
+                "max_party_size": slot.max_party_size
+            }
+            for slot in response.available_slots if slot.available
+        ]
         result = {
             "success": True,
             "restaurant": response.restaurant,
             "visit_date": response.visit_date,
             "party_size": response.party_size,
-            "available_slots": [
-                {
-                    "time": slot.time,
-                    "available": slot.available,
-                    "max_party_size": slot.max_party_size
-                }
-                for slot in response.available_slots if slot.available
-            ],
-            "total_available": len([s for s in response.available_slots if s.available])
+            "available_slots": available_slots,
+            "total_available": len(available_slots)
         }
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except ValidationError as e:
         error_msg = f"Parameter validation failed: {e.errors()[0]['msg']}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
     
     except RestaurantAPIError as e:
         error_msg = f"API call failed: {e.detail}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
     
     except Exception as e:
         error_msg = f"Failed to check availability: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool
@@ -174,11 +191,12 @@ def create_booking_tool(
         
         # Build complete customer information if any customer data provided
         customer = None
-        if any([first_name, surname, email, mobile, phone, title,
-                receive_email_marketing, receive_sms_marketing,
-                group_email_marketing_opt_in_text, group_sms_marketing_opt_in_text,
-                receive_restaurant_email_marketing, receive_restaurant_sms_marketing,
-                restaurant_email_marketing_opt_in_text, restaurant_sms_marketing_opt_in_text]):
+        # Short-circuit check; marketing flags count when set at all, so an explicit False opt-out is kept
+        if (first_name or surname or email or mobile or phone or title
+                or receive_email_marketing is not None or receive_sms_marketing is not None
+                or group_email_marketing_opt_in_text or group_sms_marketing_opt_in_text
+                or receive_restaurant_email_marketing is not None or receive_restaurant_sms_marketing is not None
+                or restaurant_email_marketing_opt_in_text or restaurant_sms_marketing_opt_in_text):
             
             customer = CustomerInfo(
                 Title=title,
@@ -226,22 +244,8 @@ def create_booking_tool(
                     customer_info = {}
                     if customer:
                         customer_info = {
-                            "title": customer.Title,
-                            "first_name": customer.FirstName,
-                            "surname": customer.Surname,
-                            "email": customer.Email,
-                            "mobile": customer.Mobile,
-                            "phone": customer.Phone,
-                            "mobile_country_code": customer.MobileCountryCode,
-                            "phone_country_code": customer.PhoneCountryCode,
-                            "receive_email_marketing": customer.ReceiveEmailMarketing,
-                            "receive_sms_marketing": customer.ReceiveSmsMarketing,
-                            "group_email_marketing_opt_in_text": customer.GroupEmailMarketingOptInText,
-                            "group_sms_marketing_opt_in_text": customer.GroupSmsMarketingOptInText,
-                            "receive_restaurant_email_marketing": customer.ReceiveRestaurantEmailMarketing,
-                            "receive_restaurant_sms_marketing": customer.ReceiveRestaurantSmsMarketing,
-                            "restaurant_email_marketing_opt_in_text": customer.RestaurantEmailMarketingOptInText,
-                            "restaurant_sms_marketing_opt_in_text": customer.RestaurantSmsMarketingOptInText
+                            _CUSTOMER_INFO_KEYS[field]: value
+                            for field, value in customer.model_dump(mode="json").items()
                         }
                     
                     # Save complete booking to local database
@@ -292,7 +296,8 @@ def create_booking_tool(
         }
         
         # Add marketing preferences to response if provided
-        if any([receive_email_marketing, receive_sms_marketing, receive_restaurant_email_marketing, receive_restaurant_sms_marketing]):
+        if (receive_email_marketing is not None or receive_sms_marketing is not None
+                or receive_restaurant_email_marketing is not None or receive_restaurant_sms_marketing is not None):
             result["marketing_preferences"] = {
                 "email_marketing": receive_email_marketing,
                 "sms_marketing": receive_sms_marketing,
@@ -300,19 +305,19 @@ def create_booking_tool(
                 "restaurant_sms_marketing": receive_restaurant_sms_marketing
             }
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except ValidationError as e:
         error_msg = f"Parameter validation failed: {e.errors()[0]['msg']}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except RestaurantAPIError as e:
         error_msg = f"API call failed: {e.detail}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except Exception as e:
         error_msg = f"Failed to create booking: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool
@@ -343,15 +348,15 @@ def get_booking_tool(booking_reference: str) -> str:
             "status": response.status
         }
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except RestaurantAPIError as e:
         error_msg = f"API call failed: {e.detail}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except Exception as e:
         error_msg = f"Failed to get booking: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool 
@@ -435,45 +440,32 @@ def update_booking_tool(
         # Note: Customer information updates would typically require a separate API call
         # or extended API support. For now, we document what customer info would be updated
         customer_updates = {}
-        if any([first_name, surname, title, email, mobile, phone, mobile_country_code, phone_country_code,
-                receive_email_marketing, receive_sms_marketing, group_email_marketing_opt_in_text,
-                group_sms_marketing_opt_in_text, receive_restaurant_email_marketing, 
-                receive_restaurant_sms_marketing, restaurant_email_marketing_opt_in_text,
-                restaurant_sms_marketing_opt_in_text]):
+        if (first_name or surname or title or email or mobile or phone or mobile_country_code or phone_country_code
+                or receive_email_marketing is not None or receive_sms_marketing is not None
+                or group_email_marketing_opt_in_text or group_sms_marketing_opt_in_text
+                or receive_restaurant_email_marketing is not None or receive_restaurant_sms_marketing is not None
+                or restaurant_email_marketing_opt_in_text or restaurant_sms_marketing_opt_in_text):
             
             # Collect customer information that would be updated
-            if first_name is not None:
-                customer_updates["FirstName"] = first_name
-            if surname is not None:
-                customer_updates["Surname"] = surname
-            if title is not None:
-                customer_updates["Title"] = title
-            if email is not None:
-                customer_updates["Email"] = email
-            if mobile is not None:
-                customer_updates["Mobile"] = mobile
-            if phone is not None:
-                customer_updates["Phone"] = phone
-            if mobile_country_code is not None:
-                customer_updates["MobileCountryCode"] = mobile_country_code
-            if phone_country_code is not None:
-                customer_updates["PhoneCountryCode"] = phone_country_code
-            if receive_email_marketing is not None:
-                customer_updates["ReceiveEmailMarketing"] = receive_email_marketing
-            if receive_sms_marketing is not None:
-                customer_updates["ReceiveSmsMarketing"] = receive_sms_marketing
-            if group_email_marketing_opt_in_text is not None:
-                customer_updates["GroupEmailMarketingOptInText"] = group_email_marketing_opt_in_text
-            if group_sms_marketing_opt_in_text is not None:
-                customer_updates["GroupSmsMarketingOptInText"] = group_sms_marketing_opt_in_text
-            if receive_restaurant_email_marketing is not None:
-                customer_updates["ReceiveRestaurantEmailMarketing"] = receive_restaurant_email_marketing
-            if receive_restaurant_sms_marketing is not None:
-                customer_updates["ReceiveRestaurantSmsMarketing"] = receive_restaurant_sms_marketing
-            if restaurant_email_marketing_opt_in_text is not None:
-                customer_updates["RestaurantEmailMarketingOptInText"] = restaurant_email_marketing_opt_in_text
-            if restaurant_sms_marketing_opt_in_text is not None:
-                customer_updates["RestaurantSmsMarketingOptInText"] = restaurant_sms_marketing_opt_in_text
+            customer_fields = (
+                ("FirstName", first_name),
+                ("Surname", surname),
+                ("Title", title),
+                ("Email", email),
+                ("Mobile", mobile),
+                ("Phone", phone),
+                ("MobileCountryCode", mobile_country_code),
+                ("PhoneCountryCode", phone_country_code),
+                ("ReceiveEmailMarketing", receive_email_marketing),
+                ("ReceiveSmsMarketing", receive_sms_marketing),
+                ("GroupEmailMarketingOptInText", group_email_marketing_opt_in_text),
+                ("GroupSmsMarketingOptInText", group_sms_marketing_opt_in_text),
+                ("ReceiveRestaurantEmailMarketing", receive_restaurant_email_marketing),
+                ("ReceiveRestaurantSmsMarketing", receive_restaurant_sms_marketing),
+                ("RestaurantEmailMarketingOptInText", restaurant_email_marketing_opt_in_text),
+                ("RestaurantSmsMarketingOptInText", restaurant_sms_marketing_opt_in_text),
+            )
+            customer_updates = {field: value for field, value in customer_fields if value is not None}
         
         result = {
             "success": True,
@@ -491,19 +483,19 @@ def update_booking_tool(
             result["customer_updates_requested"] = customer_updates
             result["note"] = "Customer information updates were noted but may require separate API calls depending on the booking system's capabilities"
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except ValidationError as e:
         error_msg = f"Parameter validation failed: {e.errors()[0]['msg']}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except RestaurantAPIError as e:
         error_msg = f"API call failed: {e.detail}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except Exception as e:
         error_msg = f"Failed to update booking: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool
@@ -538,18 +530,18 @@ def cancel_booking_tool(booking_reference: str, cancellation_reason: Optional[in
             "booking_reference": response.booking_reference,
             "restaurant": response.restaurant,
             "cancellation_reason": CANCELLATION_REASONS[cancellation_reason],
-            "cancelled_at": response.cancelled_at if hasattr(response, 'cancelled_at') else "Just now"
+            "cancelled_at": response.cancelled_at or "Just now"
         }
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except RestaurantAPIError as e:
         error_msg = f"API call failed: {e.detail}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
         
     except Exception as e:
         error_msg = f"Failed to cancel booking: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool
@@ -569,10 +561,10 @@ def user_get_bookings_validated_tool(username: str) -> str:
     try:
         user = crud.get_user_by_username(username)
         if not user:
-            return json.dumps({
+            return _to_json({
                 "success": False, 
                 "error": f"User {username} not found"
-            }, ensure_ascii=False)
+            })
         
         # Get bookings from local database
         local_bookings = crud.get_user_bookings(user.id)
@@ -587,16 +579,13 @@ def user_get_bookings_validated_tool(username: str) -> str:
         
         validated_bookings = []
         
-        for booking in local_bookings:
+        # CRITICAL FIX: Validate each booking against API server (all lookups in flight at once)
+        api_responses = api_client.get_bookings_bulk_sync([booking.booking_reference for booking in local_bookings])
+        
+        for booking, api_response in zip(local_bookings, api_responses):
             try:
-                # CRITICAL FIX: Validate each booking against API server
-                api_response = api_client.get_booking(booking.booking_reference)
-                
-                # Parse customer info
-                try:
-                    customer_info = json.loads(booking.customer_info_json) if booking.customer_info_json else {}
-                except (json.JSONDecodeError, TypeError):
-                    customer_info = {}
+                if isinstance(api_response, BaseException):
+                    raise api_response
                 
                 # Use API server as source of truth for status
                 validated_booking = {
@@ -606,7 +595,7 @@ def user_get_bookings_validated_tool(username: str) -> str:
                     "party_size": api_response.party_size,  # Use API data
                     "status": api_response.status,  # Use API status (CRITICAL)
                     "special_requests": api_response.special_requests or "None",
-                    "customer_info": customer_info,
+                    "customer_info": booking.customer_info_json or {},
                     "created_at": booking.created_at.isoformat() if booking.created_at else None,
                     "api_validated": True  # Mark as validated
                 }
@@ -622,11 +611,6 @@ def user_get_bookings_validated_tool(username: str) -> str:
                 result["validation_notes"].append(f"Could not validate booking {booking.booking_reference}: {str(api_error)}")
                 
                 # Include local data with warning
-                try:
-                    customer_info = json.loads(booking.customer_info_json) if booking.customer_info_json else {}
-                except (json.JSONDecodeError, TypeError):
-                    customer_info = {}
-                
                 stale_booking = {
                     "booking_reference": booking.booking_reference,
                     "visit_date": booking.visit_date,
@@ -634,7 +618,7 @@ def user_get_bookings_validated_tool(username: str) -> str:
                     "party_size": booking.party_size,
                     "status": f"{booking.status} (UNVALIDATED)",  # Mark as unvalidated
                     "special_requests": booking.special_requests or "None",
-                    "customer_info": customer_info,
+                    "customer_info": booking.customer_info_json or {},
                     "created_at": booking.created_at.isoformat() if booking.created_at else None,
                     "api_validated": False,
                     "warning": "Could not validate with API server"
@@ -644,11 +628,11 @@ def user_get_bookings_validated_tool(username: str) -> str:
         result["bookings"] = validated_bookings
         result["total_bookings"] = len(validated_bookings)
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except Exception as e:
         error_msg = f"Failed to get user bookings: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 @tool
@@ -668,10 +652,10 @@ def get_user_bookings_tool(username: str) -> str:
     try:
         user = crud.get_user_by_username(username)
         if not user:
-            return json.dumps({
+            return _to_json({
                 "success": False, 
                 "error": f"User {username} not found"
-            }, ensure_ascii=False)
+            })
         
         bookings = crud.get_user_bookings(user.id)
         
@@ -684,11 +668,6 @@ def get_user_bookings_tool(username: str) -> str:
         }
         
         for booking in bookings:
-            try:
-                customer_info = json.loads(booking.customer_info_json) if booking.customer_info_json else {}
-            except (json.JSONDecodeError, TypeError):
-                customer_info = {}
-            
             booking_data = {
                 "booking_reference": booking.booking_reference,
                 "visit_date": booking.visit_date,
@@ -696,16 +675,16 @@ def get_user_bookings_tool(username: str) -> str:
                 "party_size": booking.party_size,
                 "status": booking.status,
                 "special_requests": booking.special_requests or "None",
-                "customer_info": customer_info,
+                "customer_info": booking.customer_info_json or {},
                 "created_at": booking.created_at.isoformat() if booking.created_at else None
             }
             result["bookings"].append(booking_data)
         
-        return json.dumps(result, ensure_ascii=False)
+        return _to_json(result)
         
     except Exception as e:
         error_msg = f"Failed to get user bookings: {str(e)}"
-        return json.dumps({"success": False, "error": error_msg}, ensure_ascii=False)
+        return _to_json({"success": False, "error": error_msg})
 
 
 # Create alias for user-aware version - REMOVED, replaced with direct call
@@ -748,11 +727,7 @@ def update_user_profile_tool(
         if not user:
             return f"User {username} not found"
         
-        current_profile = {}
-        try:
-            current_profile = json.loads(user.profile_json) if user.profile_json else {}
-        except (json.JSONDecodeError, TypeError):
-            current_profile = {}
+        current_profile = dict(user.profile_json or {})
         
         # Update only provided fields
         updates = {}
@@ -784,14 +759,37 @@ def update_user_profile_tool(
         # Merge with current profile
         current_profile.update(updates)
         
-        # Save updated profile
-        crud.update_user_profile(username, current_profile)
+        # Save updated profile (through storage, which also drops the cached user response)
+        storage.update_user_profile(username, current_profile)
         
         return f"User profile updated successfully. Updated fields: {', '.join(updates.keys())}"
         
     except Exception as e:
         return f"Failed to update user profile: {str(e)}"
 
+
+# Days smart_availability_search_tool queries per round trip
+_AVAILABILITY_WINDOW_DAYS = 7
+
+def _check_availability_window(dates: List[date], party_size: int) -> Dict[date, Any]:
+    """并发查询一组日期的可用性，返回 日期 -> 响应或异常（参数验证失败的日期记录为异常）"""
+    day_requests = {}
+    day_responses = {}
+    for current_date in dates:
+        try:
+            day_requests[current_date] = AvailabilityRequest(
+                VisitDate=current_date,
+                PartySize=party_size,
+                ChannelCode="ONLINE"
+            )
+        except ValidationError as e:
+            day_responses[current_date] = e
+    
+    if day_requests:
+        day_responses.update(zip(day_requests, api_client.check_availability_bulk_sync(list(day_requests.values()))))
+    return day_responses
+
+
 @tool
 def smart_availability_search_tool(
     party_size: int, 
@@ -814,7 +812,6 @@ def smart_availability_search_tool(
     """
     try:
         from datetime import datetime, timedelta
-        import json
         from ..config import config
         
         # 使用配置中的最大搜索天数
@@ -822,19 +819,19 @@ def smart_availability_search_tool(
         
         # 验证参数
         if party_size <= 0 or party_size > 20:
-            return json.dumps({
+            return _to_json({
                 "success": False,
                 "error": "用餐人数必须在1-20之间"
-            }, ensure_ascii=False)
+            })
         
         # 解析开始日期
         try:
             start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
         except ValueError:
-            return json.dumps({
+            return _to_json({
                 "success": False,
                 "error": f"日期格式错误：{start_date}，请使用YYYY-MM-DD格式"
-            }, ensure_ascii=False)
+            })
         
         search_results = {
             "success": False,
@@ -851,22 +848,25 @@ def smart_availability_search_tool(
             "recommendation": None
         }
         
-        # 智能循环查找
-        for day_offset in range(max_days_to_check):
-            current_date = start_date_obj + timedelta(days=day_offset)
+        search_dates = [start_date_obj + timedelta(days=day_offset) for day_offset in range(max_days_to_check)]
+        day_responses = {}
+        
+        # 按日期顺序处理结果
+        for day_offset, current_date in enumerate(search_dates):
+            # 每次并发查询一个窗口（一周）的日期；找到可用日期后即停止，不再请求后续窗口
+            if current_date not in day_responses:
+                day_responses.update(_check_availability_window(
+                    search_dates[day_offset:day_offset + _AVAILABILITY_WINDOW_DAYS], party_size
+                ))
+            
             current_date_str = current_date.strftime("%Y-%m-%d")
             
             search_results["search_summary"]["days_checked"] = day_offset + 1
             
             try:
-                # 直接调用API客户端，不通过工具层
-                request = AvailabilityRequest(
-                    VisitDate=current_date,
-                    PartySize=party_size,
-                    ChannelCode="ONLINE"
-                )
-                
-                response = api_client.check_availability(request)
+                response = day_responses[current_date]
+                if isinstance(response, Exception):
+                    raise response
                 
                 # 过滤可用时段
                 available_slots = [
@@ -964,7 +964,7 @@ def smart_availability_search_tool(
                 "next_search_date": (start_date_obj + timedelta(days=max_days_to_check)).strftime("%Y-%m-%d")
             }
         
-        return json.dumps(search_results, ensure_ascii=False)
+        return _to_json(search_results)
         
     except Exception as e:
         error_result = {
@@ -972,7 +972,7 @@ def smart_availability_search_tool(
             "error": f"智能搜索失败: {str(e)}",
             "fallback_suggestion": "请尝试单日查询或联系客服"
         }
-        return json.dumps(error_result, ensure_ascii=False)
+        return _to_json(error_result)
 
 # Export all tools - 更新工具列表
 BOOKING_TOOLS = [